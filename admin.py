@@ -1,21 +1,53 @@
 import logging
 from django.contrib import admin
-from django.utils.timezone import now
+from django.db.models import Count, Exists, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from datetime import timedelta
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from rangefilter.filters import DateRangeFilter
-import csv
-from reportlab.pdfgen import canvas
-from .models import Product, HostnameAssignment, TransferLog
+from django.utils.html import format_html
+from .exports import stream_queryset_csv
+from .forms import TransferActionForm
+from .jobs import enqueue, retry
+from .reports import get_inline_report_limit, with_serial_numbers, write_assignment_pdf
+from .models import Product, HostnameAssignment, Job, TransferLog
+from .pagination import ApproximateCountAdminMixin
+from . import profiling
+from .search import IndexedSearchAdminMixin
+from .transfers import transfer_products
+from .views import job_result_response
 from django.contrib import messages
-from django.urls import path
-from django.shortcuts import render
+from django.urls import path, reverse
+from django.shortcuts import get_object_or_404, render
 
 
 logger = logging.getLogger(__name__)
 
+
+def assignment_pdf_response(request, assignments, title, filename, numbered=False):
+    # Small reports are returned directly; large ones are queued as a job and
+    # downloaded from the job page linked in the message.
+    if assignments.count() <= get_inline_report_limit():
+        response = HttpResponse(content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        write_assignment_pdf(response, title, assignments, numbered=numbered)
+        return response
+
+    job = enqueue(
+        'assignment_report', user=request.user, title=title, filename=filename, numbered=numbered,
+        ids=list(assignments.values_list('pk', flat=True)),
+    )
+    queued_job_message(request, job)
+
+
+def queued_job_message(request, job):
+    url = reverse('admin:products_job_change', args=[job.pk])
+    messages.info(request, format_html(
+        'The report has been queued as job #{}. <a href="{}">Download it here</a> once it is ready.', job.pk, url,
+    ))
+
 class UpdatedHourlyFilter(admin.SimpleListFilter):
     title = "Updated At"
     parameter_name = "updated_at"
@@ -30,23 +62,59 @@ class UpdatedHourlyFilter(admin.SimpleListFilter):
         ]
 
     def queryset(self, request, queryset):
+        # Half-open [start, end) ranges on the raw column so the updated_at
+        # index can be used; __date/__month/__year wrap it in functions.
+        current = timezone.localtime()
+        today = current.replace(hour=0, minute=0, second=0, microsecond=0)
         if self.value() == "hourly":
-            return queryset.filter(updated_at__gte=now() - timedelta(hours=1))
+            return queryset.filter(updated_at__gte=current - timedelta(hours=1))
         if self.value() == "today":
-            return queryset.filter(updated_at__date=now().date())
+            return _updated_between(queryset, today, today + timedelta(days=1))
         if self.value() == "past_7_days":
-            return queryset.filter(updated_at__gte=now() - timedelta(days=7))
+            return queryset.filter(updated_at__gte=current - timedelta(days=7))
         if self.value() == "this_month":
-            return queryset.filter(updated_at__month=now().month, updated_at__year=now().year)
+            month = today.replace(day=1)
+            return _updated_between(queryset, month, _next_month(month))
         if self.value() == "this_year":
-            return queryset.filter(updated_at__year=now().year)
+            year = today.replace(month=1, day=1)
+            return _updated_between(queryset, year, year.replace(year=year.year + 1))
         return queryset
 
+
+def _next_month(start):
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def _updated_between(queryset, start, end):
+    # Boundaries are computed as local wall times and made aware again, so a
+    # DST change inside the range doesn't shift them.
+    return queryset.filter(
+        updated_at__gte=timezone.make_aware(start.replace(tzinfo=None)),
+        updated_at__lt=timezone.make_aware(end.replace(tzinfo=None)),
+    )
+
 class TransferLogInline(admin.TabularInline):
     model = TransferLog
     extra = 0
     fields = ['sender', 'receiver', 'transferred_at']
-    readonly_fields = ['transferred_at'] 
+    readonly_fields = ['sender', 'receiver', 'transferred_at']
+    can_delete = False
+    # Shared devices can collect thousands of transfers; the change page
+    # only shows the most recent ones.
+    max_transfers = 50
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request).select_related('sender', 'receiver')
+        object_id = request.resolver_match.kwargs.get('object_id') if request.resolver_match else None
+        if object_id is None:
+            return queryset
+        recent = TransferLog.objects.filter(product_id=object_id).order_by('-transferred_at', '-id')
+        return queryset.filter(pk__in=list(recent.values_list('pk', flat=True)[:self.max_transfers])).order_by('-transferred_at', '-id')
 
 class Past7DaysFilter(admin.SimpleListFilter):
     title = _('Report in Past 7 Days')
@@ -58,67 +126,64 @@ class Past7DaysFilter(admin.SimpleListFilter):
     def queryset(self, request, queryset):
         if self.value() == 'True':
             seven_days_ago = timezone.now() - timedelta(days=7)
-            return queryset.filter(transferlog__transferred_at__gte=seven_days_ago).distinct()
+            recent = TransferLog.objects.filter(product=OuterRef('pk'), transferred_at__gte=seven_days_ago)
+            return queryset.filter(Exists(recent))
         return queryset
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
-    list_display = ('id','hostname', 'user', 'host_name_category', 'serial_number')  # Updated display
+class ProductAdmin(IndexedSearchAdminMixin, ApproximateCountAdminMixin, admin.ModelAdmin):
+    list_display = ('id','hostname', 'user', 'host_name_category', 'serial_number', 'get_transfer_count')  # Updated display
+    list_select_related = ('user',)
     list_filter = ('created_at', Past7DaysFilter, UpdatedHourlyFilter)
-    search_fields = ('host_name_category', 'user__username')  # Adjusted search
+    search_fields = ('serial_number', 'model_number', 'hostname', 'mac_address', 'lan_ip', 'wan_ip', 'department', 'location')
+    extra_search_fields = ('host_name_category', 'user__username')
     inlines = [TransferLogInline]
-    actions = ['download_transfer_report', 'export_as_pdf']
+    actions = ['transfer_selected', 'download_transfer_report', 'export_as_pdf']
+    action_form = TransferActionForm
+
+    def get_queryset(self, request):
+        transfers = TransferLog.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        return super().get_queryset(request).annotate(
+            transfer_count=Coalesce(Subquery(transfers.annotate(count=Count('pk')).values('count')), 0),
+        )
 
     def get_transfer_count(self, obj):
-        return TransferLog.objects.filter(product=obj).count()
+        return obj.transfer_count
     get_transfer_count.short_description = 'Transfer Count'
+    get_transfer_count.admin_order_field = 'transfer_count'
+
+    def transfer_selected(self, request, queryset):
+        form = self.action_form(request.POST)
+        form.fields['action'].choices = self.get_action_choices(request)
+        receiver = form.cleaned_data['receiver'] if form.is_valid() else None
+        if receiver is None:
+            self.message_user(request, "Choose a user to transfer the selected products to.", messages.WARNING)
+            return None
+        count = transfer_products(queryset, receiver)
+        self.message_user(request, f"Transferred {count} products to {receiver}.", messages.SUCCESS)
+        return None
+    transfer_selected.short_description = 'Transfer selected products'
 
     def download_transfer_report(self, request, queryset):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="transfer_report.csv"'
-        writer = csv.writer(response)
-        writer.writerow(['Host Name', 'Sender', 'Receiver', 'Transferred At'])  # Updated header
-        for log in TransferLog.objects.filter(product__in=queryset):
-            writer.writerow([log.product.hostname, log.sender.username if log.sender else 'N/A',
-                             log.receiver.username if log.receiver else 'N/A', log.transferred_at])
-        return response
+        transfers = TransferLog.objects.filter(product__in=queryset)
+        if transfers.count() > get_inline_report_limit():
+            product_ids = list(queryset.values_list('pk', flat=True))
+            queued_job_message(request, enqueue('transfer_report', user=request.user, product_ids=product_ids))
+            return None
+        return stream_queryset_csv(
+            'transfer_report.csv',
+            ['Host Name', 'Sender', 'Receiver', 'Transferred At'],
+            transfers,
+            ['product__hostname', 'sender__username', 'receiver__username', 'transferred_at'],
+        )
     download_transfer_report.short_description = 'Download Transfer History as CSV'
 
     def export_as_pdf(self, request, queryset):
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="used_items_report.pdf"'
-        
-        p = canvas.Canvas(response)
-        p.setFont("Helvetica", 12)
-        p.drawString(200, 800, "ITEMS ASSIGNED REPORT FOR PAST 7 DAYS")
-        
-        y_position = 780
-        p.setFont("Helvetica", 10)
-        p.drawString(50, y_position, "Host Name")  # Updated column header
-        p.drawString(70, y_position, "Serial Number")  # Added serial number column
-        p.drawString(200, y_position, "User")
-        p.drawString(350, y_position, "Assigned Date")
-        p.drawString(500, y_position, "Returned Date")
-        y_position -= 20
-        
         seven_days_ago = timezone.now() - timedelta(days=7)
-        assignments = HostnameAssignment.objects.filter(assigned_date__gte=seven_days_ago)
-
-        for assignment in assignments:
-            p.drawString(50, y_position, assignment.product.hostname)  # Updated to hostname
-            p.drawString(70, y_position, assignment.product.serial_number)  # Added serial number
-            p.drawString(200, y_position, assignment.user.username if assignment.user else "N/A")
-            p.drawString(350, y_position, assignment.assigned_date.strftime('%Y-%m-%d %H:%M'))
-            p.drawString(500, y_position, assignment.returned_date.strftime('%Y-%m-%d %H:%M') if assignment.returned_date else "N/A")
-            y_position -= 20
-
-            # Create a new page if space is running out
-            if y_position < 50:  
-                p.showPage()
-                y_position = 800
-
-        p.save()
-        return response
+        assignments = HostnameAssignment.objects.filter(assigned_date__gte=seven_days_ago).order_by('-assigned_date')
+        return assignment_pdf_response(
+            request, assignments, "ITEMS ASSIGNED REPORT FOR PAST 7 DAYS", 'used_items_report.pdf',
+        )
     export_as_pdf.short_description = "Export Used Items Report as PDF"
 
     def changelist_view(self, request, extra_context=None):
@@ -127,17 +192,23 @@ class ProductAdmin(admin.ModelAdmin):
         return super().changelist_view(request, extra_context=extra_context)
 
 @admin.register(HostnameAssignment)
-class ItemAssignmentAdmin(admin.ModelAdmin):
+class ItemAssignmentAdmin(IndexedSearchAdminMixin, ApproximateCountAdminMixin, admin.ModelAdmin):
     #list_display = ('hostname', 'user', 'assigned_date', 'unassigned_date', 'status')
     list_display = ('id','hostname', 'get_serial_number', 'user', 'assigned_date', 'unassigned_date', 'status')
     list_filter = (('assigned_date', DateRangeFilter), ('unassigned_date', DateRangeFilter))
-    search_fields = ('user__username', 'hostname')
+    search_fields = ('hostname',)
+    extra_search_fields = ('user__username',)
     ordering = ('-assigned_date',)
+    list_select_related = ('user',)
     actions = ["export_as_pdf", "export_as_excel", "download_assigned", "download_unassigned"]
 
-    def get__serial_number(self, obj):
-        return obj.get_serial_number()
-    get__serial_number.short_description = 'Serial Number'
+    def get_queryset(self, request):
+        return with_serial_numbers(super().get_queryset(request))
+
+    def get_serial_number(self, obj):
+        return obj.serial_number or "N/A"
+    get_serial_number.short_description = 'Serial Number'
+    get_serial_number.admin_order_field = 'serial_number'
 
     def get_urls(self):
         urls = super().get_urls()
@@ -157,43 +228,28 @@ class ItemAssignmentAdmin(admin.ModelAdmin):
     view_report.short_description = "View Report in Admin"
 
     def export_as_pdf(self, request, queryset):
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="item_assignment_report.pdf"'
-
-        p = canvas.Canvas(response)
-        p.setFont("Helvetica-Bold", 14)
-        p.drawString(200, 800, "HOSTNAME ASSIGNMENT REPORT")
-        p.line(200, 795, 420, 795)
-
-        y_position = 780
-        p.setFont("Helvetica", 10)
-        p.drawString(30, y_position, "No.")
-        p.drawString(70, y_position, "Hostname")
-        p.drawString(150, y_position, "Serial Number")
-        p.drawString(250, y_position, "User")
-        p.drawString(350, y_position, "Assigned Date")
-        p.drawString(500, y_position, "Unassigned Date")
-        y_position -= 20
-
-        for index, assignment in enumerate(queryset, start=1):
-            p.drawString(30, y_position, str(index))
-            p.drawString(70, y_position, assignment.hostname)
-            p.drawString(150, y_position, assignment.get_serial_number())
-            p.drawString(250, y_position, assignment.user.username if assignment.user else "N/A")
-            p.drawString(350, y_position, assignment.assigned_date.strftime('%Y-%m-%d'))
-            p.drawString(500, y_position, assignment.unassigned_date.strftime('%Y-%m-%d') if assignment.unassigned_date else "N/A")
-            y_position -= 20
-
-            if y_position < 50:
-                p.showPage()
-                y_position = 800
-                p.setFont("Helvetica", 10)
-
-        p.save()
-        return response
+        return assignment_pdf_response(
+            request, queryset, "HOSTNAME ASSIGNMENT REPORT", 'item_assignment_report.pdf', numbered=True,
+        )
 
     export_as_pdf.short_description = "Download PDF To Print"
 
+    def _download_by_status(self, queryset, status, filename):
+        return stream_queryset_csv(
+            filename,
+            ['Hostname', 'Serial Number', 'User', 'Assigned Date', 'Unassigned Date', 'Status'],
+            with_serial_numbers(queryset.filter(status=status)).order_by('-assigned_date'),
+            ['hostname', 'serial_number', 'user__username', 'assigned_date', 'unassigned_date', 'status'],
+        )
+
+    def download_assigned(self, request, queryset):
+        return self._download_by_status(queryset, 'Assigned', 'assigned_hostnames.csv')
+    download_assigned.short_description = "Download Assigned as CSV"
+
+    def download_unassigned(self, request, queryset):
+        return self._download_by_status(queryset, 'Unassigned', 'unassigned_hostnames.csv')
+    download_unassigned.short_description = "Download Unassigned as CSV"
+
 
 #stock received
 from .models import StockInvoice, StockReceive
@@ -207,20 +263,30 @@ class StockReceiveAdmin(admin.ModelAdmin):
     search_fields = ('invoice__invoice_no', 'invoice__supplier_name', 'item_category', 'model_number')
     readonly_fields = ('total_amount',)  # to make total_amount read-only to avoid form errors
 
+    # The invoice columns are read from annotations so rendering a row never
+    # dereferences obj.invoice.
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            invoice_supplier_name=F('invoice__supplier_name'),
+            invoice_number=F('invoice__invoice_no'),
+            invoice_received_by=F('invoice__received_by__username'),
+            invoice_date_received=F('invoice__date_received'),
+        )
+
     def supplier_name(self, obj):
-        return obj.invoice.supplier_name
+        return obj.invoice_supplier_name
     supplier_name.admin_order_field = 'invoice__supplier_name'
 
     def invoice_no(self, obj):
-        return obj.invoice.invoice_no
+        return obj.invoice_number
     invoice_no.admin_order_field = 'invoice__invoice_no'
 
     def received_by(self, obj):
-        return obj.invoice.received_by
-    received_by.admin_order_field = 'invoice__received_by'
+        return obj.invoice_received_by
+    received_by.admin_order_field = 'invoice__received_by__username'
 
     def date_received(self, obj):
-        return obj.invoice.date_received
+        return obj.invoice_date_received
     date_received.admin_order_field = 'invoice__date_received'
 
 
@@ -233,8 +299,84 @@ class StockReceiveInline(admin.TabularInline):
 class StockInvoiceAdmin(admin.ModelAdmin):
     list_display = ['id','invoice_no', 'supplier_name', 'received_by', 'date_received', 'total_items', 'total_amount']
     list_filter = ['supplier_name', 'date_received']
+    list_select_related = ('received_by',)
     inlines = [StockReceiveInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_totals()
+
+    def total_items(self, obj):
+        return obj.item_count
+    total_items.short_description = 'Total Items'
+    total_items.admin_order_field = 'item_count'
+
+    def total_amount(self, obj):
+        return obj.amount_total
+    total_amount.short_description = 'Total Amount'
+    total_amount.admin_order_field = 'amount_total'
+
 
 admin.site.register(StockReceive, StockReceiveAdmin)
 
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'get_progress', 'user', 'created_at', 'finished_at', 'get_result')
+    list_filter = ('status', 'name')
+    list_select_related = ('user',)
+    readonly_fields = [field.name for field in Job._meta.fields] + ['get_result']
+    actions = ['retry_selected']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_progress(self, obj):
+        if obj.total:
+            return f"{obj.progress}/{obj.total}"
+        return obj.progress or "-"
+    get_progress.short_description = 'Progress'
+
+    def retry_selected(self, request, queryset):
+        count = retry(queryset)
+        self.message_user(request, f"Queued {count} failed jobs again.", messages.SUCCESS)
+    retry_selected.short_description = 'Retry selected failed jobs'
+
+    def get_result(self, obj):
+        if not obj.result:
+            return "-"
+        return format_html('<a href="{}">Download</a>', reverse('admin:products_job_download', args=[obj.pk]))
+    get_result.short_description = 'Result'
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('<int:job_id>/download/', self.admin_site.admin_view(self.download_view), name='products_job_download'),
+        ]
+        return custom_urls + urls
+
+    def download_view(self, request, job_id):
+        job = get_object_or_404(Job, pk=job_id)
+        if not job.result or not (self.has_view_permission(request, job) or job.is_visible_to(request.user)):
+            raise Http404("No job result matches the given query.")
+        return job_result_response(job)
+
+
+def request_profiles_view(request):
+    """
+    Slowest endpoints from the sampled requests kept by ProfilingMiddleware.
+    Wrapped with admin.site.admin_view in urls.py, so only staff can see it.
+    """
+    if request.method == 'POST':
+        profiling.samples.clear()
+        messages.success(request, "Profiling samples cleared.")
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Slowest endpoints',
+        'endpoints': profiling.slowest_endpoints(),
+        'sample_count': len(profiling.samples),
+        'sample_rate': profiling.get_sample_rate(),
+    }
+    return render(request, 'admin/request_profiles.html', context)
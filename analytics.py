@@ -0,0 +1,50 @@
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils.timezone import localdate
+
+from .models import SpendRollup
+
+
+DIMENSIONS = ('supplier_name', 'item_category', 'unit_of_measure')
+
+
+def _totals(rows, dimension=None):
+    if dimension is None:
+        return rows.aggregate(quantity=Coalesce(Sum('quantity'), 0), amount=Coalesce(Sum('amount'), Decimal('0.00')))
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Unknown spend dimension {dimension!r}; expected one of {', '.join(DIMENSIONS)}.")
+    return list(
+        rows.values(dimension).annotate(quantity=Sum('quantity'), amount=Sum('amount')).order_by('-amount', dimension)
+    )
+
+
+def year_to_date(dimension=None, today=None):
+    """
+    Spend and quantity from 1 January up to ``today``, in total or broken
+    down by one of DIMENSIONS. Whole months come from the monthly rollups
+    and the current month from the daily ones, so no line items are read.
+    """
+    today = today or localdate()
+    month_start = today.replace(day=1)
+    rows = SpendRollup.objects.filter(
+        Q(period=SpendRollup.MONTH, period_start__gte=today.replace(month=1, day=1), period_start__lt=month_start)
+        | Q(period=SpendRollup.DAY, period_start__gte=month_start, period_start__lte=today)
+    )
+    return _totals(rows, dimension)
+
+
+def monthly_spend(months=12, today=None):
+    """
+    Spend and quantity per month for the last ``months`` months, oldest first.
+    """
+    today = today or localdate()
+    first = today.year * 12 + today.month - months
+    rows = SpendRollup.objects.filter(
+        period=SpendRollup.MONTH,
+        period_start__gte=date(first // 12, first % 12 + 1, 1),
+        period_start__lte=today,
+    )
+    return list(rows.values('period_start').annotate(quantity=Sum('quantity'), amount=Sum('amount')).order_by('period_start'))
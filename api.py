@@ -0,0 +1,138 @@
+import hashlib
+
+from django.contrib.auth.models import User
+from django.db.models import Prefetch
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import permissions, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.routers import DefaultRouter
+
+from .lookups import MAX_LOOKUP_CODES, lookup_products
+from .models import HostnameAssignment, Product, TransferLog
+from .search import search
+from .serializers import HostnameAssignmentSerializer, ProductSerializer, TransferLogSerializer
+
+
+class IdCursorPagination(CursorPagination):
+    ordering = '-id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class ConditionalGetMixin:
+    """
+    Answer GETs with ETag/Last-Modified validators derived from
+    ``last_modified_field`` so pollers receive 304 Not Modified when
+    nothing they asked for has changed.
+
+    The validators cover the rows being returned: a list request hashes the
+    ids and timestamps of its page, so it costs the page query rather than
+    an aggregate over the whole table.
+    """
+    last_modified_field = None
+
+    def get_validators(self, request, rows):
+        stamps = [getattr(row, self.last_modified_field) for row in rows]
+        last_modified = max(filter(None, stamps), default=None)
+        source = '|'.join([request.get_full_path()] + [f"{row.pk}:{stamp}" for row, stamp in zip(rows, stamps)])
+        etag = quote_etag(hashlib.sha256(source.encode()).hexdigest()[:32])
+        return etag, last_modified.timestamp() if last_modified else None
+
+    def conditional(self, request, rows, respond):
+        etag, last_modified = self.get_validators(request, rows)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        response = respond()
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if self.last_modified_field is None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            rows = list(queryset)
+            return self.conditional(request, rows, lambda: Response(self.get_serializer(rows, many=True).data))
+        return self.conditional(
+            request, page, lambda: self.get_paginated_response(self.get_serializer(page, many=True).data),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if self.last_modified_field is None:
+            return super().retrieve(request, *args, **kwargs)
+        instance = self.get_object()
+        return self.conditional(request, [instance], lambda: Response(self.get_serializer(instance).data))
+
+
+class SearchActionMixin:
+    @action(detail=False)
+    def search(self, request):
+        """
+        Substring search over the indexed fields: ``?q=3c:2b 10.0.4``.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': "Expected a search term."})
+        page = self.paginate_queryset(search(self.filter_queryset(self.get_queryset()), query))
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+
+class ProductViewSet(SearchActionMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Product.objects.select_related('user').prefetch_related(
+        Prefetch('users', queryset=User.objects.only('id', 'username')),
+    )
+    serializer_class = ProductSerializer
+    pagination_class = IdCursorPagination
+    permission_classes = [permissions.IsAuthenticated]
+    last_modified_field = 'updated_at'
+
+    @action(detail=False, methods=['post'])
+    def lookup(self, request):
+        """
+        Resolve a batch of scanned barcodes: ``{"codes": ["SN123", ...]}``.
+        """
+        codes = request.data.get('codes') if isinstance(request.data, dict) else None
+        if not isinstance(codes, list) or not all(isinstance(code, str) for code in codes):
+            raise ValidationError({'codes': "Expected a list of scanned codes."})
+        if len(codes) > MAX_LOOKUP_CODES:
+            raise ValidationError({'codes': f"At most {MAX_LOOKUP_CODES} codes per request."})
+
+        matches, missing = lookup_products(codes)
+        serializer_context = self.get_serializer_context()
+        return Response({
+            'results': {
+                code: ProductSerializer(products, many=True, context=serializer_context).data
+                for code, products in matches.items()
+            },
+            'missing': missing,
+        })
+
+
+class TransferLogViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = TransferLog.objects.select_related('product', 'sender', 'receiver')
+    serializer_class = TransferLogSerializer
+    pagination_class = IdCursorPagination
+    permission_classes = [permissions.IsAuthenticated]
+    last_modified_field = 'transferred_at'
+
+
+class HostnameAssignmentViewSet(SearchActionMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = HostnameAssignment.objects.select_related('product', 'user')
+    serializer_class = HostnameAssignmentSerializer
+    pagination_class = IdCursorPagination
+    permission_classes = [permissions.IsAuthenticated]
+
+
+router = DefaultRouter()
+router.register('products', ProductViewSet)
+router.register('transfers', TransferLogViewSet)
+router.register('assignments', HostnameAssignmentViewSet)
@@ -13,7 +13,12 @@
 #     name = 'products'
 # your_app_name/apps.py
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 class YourAppNameConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'products' 
\ No newline at end of file
+    name = 'products'
+
+    def ready(self):
+        from .search import install_search_index
+        post_migrate.connect(install_search_index, sender=self)
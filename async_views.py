@@ -0,0 +1,46 @@
+"""
+Async variants of the read-only views, for deployments served through
+asgi.py. They fetch everything with the async ORM before rendering, so no
+query runs in the event loop thread and no worker thread is held while
+waiting on the database.
+"""
+from django.core.paginator import Paginator
+from django.http import Http404
+from django.shortcuts import render
+
+from .models import Product, TransferLog
+from .pagination import CursorPaginator, aget_page, parse_cursor
+from .views import INVENTORY_PAGE_SIZE, USERS_PER_PAGE, _first_products_of, _product_owner_ids
+
+
+async def product_list(request):
+    page = await aget_page(Paginator(_product_owner_ids(), USERS_PER_PAGE), request.GET.get("page"))
+    grouped_products = {}
+    async for product in _first_products_of(list(page)):
+        grouped_products.setdefault(product.user, []).append(product)
+
+    return render(request, "list.html", {"grouped_products": grouped_products, "page_obj": page})
+
+
+async def product_transfer_history(request, product_id):
+    try:
+        product = await Product.objects.aget(unique_id=product_id)
+    except Product.DoesNotExist:
+        raise Http404("No product matches the given query.")
+    transfers = TransferLog.objects.filter(product=product).select_related('sender', 'receiver')
+    transfers = [transfer async for transfer in transfers.order_by("-transferred_at")]
+    return render(request, "transfer_history.html", {"product": product, "transfers": transfers})
+
+
+async def inventory_list(request):
+    if "page" in request.GET:
+        paginator = Paginator(Product.objects.order_by("id"), INVENTORY_PAGE_SIZE)
+        products = await aget_page(paginator, request.GET.get("page"))
+    else:
+        paginator = CursorPaginator(Product.objects.all(), INVENTORY_PAGE_SIZE)
+        products = await paginator.aget_page(
+            after=parse_cursor(request.GET.get("after")),
+            before=parse_cursor(request.GET.get("before")),
+        )
+
+    return render(request, "base.html", {"products": products})
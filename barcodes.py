@@ -0,0 +1,175 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from io import BytesIO
+
+import barcode
+from barcode.writer import ImageWriter, SVGWriter
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from rest_framework.utils import json
+
+from .cache import LRUCache
+
+
+FORMATS = {
+    'png': (ImageWriter, 'image/png'),
+    'svg': (SVGWriter, 'image/svg+xml'),
+}
+
+# Below this many images the pool start-up costs more than it saves.
+MIN_POOL_BATCH = 50
+
+
+def get_writer_options():
+    return dict(getattr(settings, 'PRODUCT_BARCODE_WRITER_OPTIONS', {}))
+
+
+def barcode_key(data, fmt='png', options=None):
+    """
+    Content address of a rendered barcode: the same payload, format and
+    writer options always map to the same key.
+    """
+    if options is None:
+        options = get_writer_options()
+    source = json.dumps([data, fmt, sorted(options.items())], default=str)
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def render(data, fmt='png', options=None):
+    writer_class, _ = FORMATS[fmt]
+    barcode_class = barcode.get_barcode_class('code128')
+    barcode_instance = barcode_class(data, writer=writer_class())
+    buffer = BytesIO()
+    barcode_instance.write(buffer, options=get_writer_options() if options is None else options)
+    return buffer.getvalue()
+
+
+def render_png(data, options=None):
+    return render(data, 'png', options)
+
+
+class BarcodeCache:
+    """
+    Two-tier cache of rendered barcodes: a small in-process LRU in front of
+    content-addressed files in the default storage.
+    """
+
+    def __init__(self, max_entries=256, location='barcodes/cache', storage=None):
+        self.location = location
+        self._storage = storage
+        self._memory = LRUCache(max_entries)
+
+    @property
+    def storage(self):
+        return self._storage or default_storage
+
+    def path(self, key, fmt):
+        return f'{self.location}/{key[:2]}/{key}.{fmt}'
+
+    def contains(self, key, fmt):
+        return (key, fmt) in self._memory or self.storage.exists(self.path(key, fmt))
+
+    def get(self, key, fmt):
+        content = self._memory.get((key, fmt))
+        if content is not None:
+            return content
+        name = self.path(key, fmt)
+        if not self.storage.exists(name):
+            return None
+        with self.storage.open(name, 'rb') as file:
+            content = file.read()
+        self._memory.set((key, fmt), content)
+        return content
+
+    def set(self, key, fmt, content):
+        name = self.path(key, fmt)
+        if not self.storage.exists(name):
+            self.storage.save(name, ContentFile(content))
+        self._memory.set((key, fmt), content)
+        return name
+
+    def get_or_render(self, data, fmt='png'):
+        options = get_writer_options()
+        key = barcode_key(data, fmt, options)
+        content = self.get(key, fmt)
+        if content is None:
+            content = render(data, fmt, options)
+            self.set(key, fmt, content)
+        return key, content
+
+    def clear(self):
+        self._memory.clear()
+
+
+barcode_cache = BarcodeCache(getattr(settings, 'PRODUCT_BARCODE_CACHE_SIZE', 256))
+
+
+def attach_barcode(product, image=None):
+    """
+    Point ``product.barcode`` at the cached PNG for its payload, rendering it
+    first when it is not cached yet. Products sharing a payload share a file.
+    """
+    key = barcode_key(product.get_barcode_data())
+    if image is None:
+        if not barcode_cache.contains(key, 'png'):
+            image = render_png(product.get_barcode_data())
+    if image is not None:
+        barcode_cache.set(key, 'png', image)
+    product.barcode = barcode_cache.path(key, 'png')
+    product.mark_barcode_rendered()
+
+
+def get_worker_count():
+    return getattr(settings, 'PRODUCT_BARCODE_WORKERS', None) or os.cpu_count() or 1
+
+
+def barcode_pool(workers=None):
+    """
+    Process pool for render_barcodes(), or None when rendering runs inline.
+    Callers rendering several batches share one pool instead of starting
+    a new one per batch.
+    """
+    workers = workers or get_worker_count()
+    return ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+
+def render_barcodes(products, workers=None, batch_size=500, pool=None):
+    """
+    Render barcodes for every product whose barcode payload changed and
+    store them with a single bulk update. Payloads already in the cache are
+    not rendered again; PNG rendering is CPU bound, so large batches are
+    spread over a process pool (``pool``, or one started for this call).
+
+    Returns the number of products whose barcode was updated.
+    """
+    from .models import Product
+
+    products = [product for product in products if product.barcode_is_stale()]
+    if not products:
+        return 0
+
+    missing = {}
+    for product in products:
+        data = product.get_barcode_data()
+        if data not in missing and not barcode_cache.contains(barcode_key(data), 'png'):
+            missing[data] = None
+
+    payloads = list(missing)
+    workers = workers or get_worker_count()
+    if (pool is not None or workers > 1) and len(payloads) >= MIN_POOL_BATCH:
+        with ExitStack() as stack:
+            if pool is None:
+                pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+            chunksize = max(1, len(payloads) // (workers * 4))
+            images = list(pool.map(render_png, payloads, chunksize=chunksize))
+    else:
+        images = [render_png(payload) for payload in payloads]
+    missing.update(zip(payloads, images))
+
+    for product in products:
+        attach_barcode(product, missing.get(product.get_barcode_data()))
+    Product.objects.bulk_update(products, ['barcode'], batch_size=batch_size)
+    return len(products)
@@ -0,0 +1,293 @@
+"""
+Query-count and latency benchmarks for the products app.
+
+Run against SQLite with the regular test runner:
+
+    python manage.py test products.benchmarks
+
+PRODUCTS_BENCHMARK_SIZE sets how many products are seeded (default 10000,
+e.g. 100000 for the full-size run). PRODUCTS_BENCHMARK_TIME_FACTOR scales
+the time budgets for slower machines. A scenario fails when it issues more
+queries than its budget or runs slower than its time budget.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, reverse
+from django.utils.timezone import now
+
+from . import views
+from .models import HostnameAssignment, Product, StockInvoice, StockReceive, TransferLog
+
+
+BENCHMARK_SIZE = int(os.environ.get('PRODUCTS_BENCHMARK_SIZE', 10000))
+TIME_FACTOR = float(os.environ.get('PRODUCTS_BENCHMARK_TIME_FACTOR', 1))
+
+USER_COUNT = 200
+UPLOAD_ROWS = 1000
+ITEMS_PER_INVOICE = 5
+
+# scenario: (max queries, max seconds for 10k products; scaled linearly above that)
+BUDGETS = {
+    'product_list': (3, 1),
+    'inventory_list': (1, 1),
+    'upload_products': (25, 30),
+    'reupload_products': (10, 5),
+    'transfer_to': (4, 1),
+    'edit_product': (1, 1),
+    'resave_product': (0, 1),
+    'edit_assignment': (1, 1),
+    'bulk_transfer': (160, 5),
+    'product_changelist': (10, 5),
+    'assignment_changelist': (10, 5),
+    'invoice_changelist': (10, 5),
+    'receive_changelist': (10, 5),
+    'download_transfer_report': (8, 20),
+    'product_export_as_pdf': (8, 20),
+    'assignment_export_as_pdf': (8, 20),
+    'download_assigned': (8, 10),
+    'download_unassigned': (8, 10),
+}
+
+# Scenarios that write in fixed-size batches; their query budgets scale with
+# the seeded size like the time budgets do.
+BATCHED_SCENARIOS = {'bulk_transfer'}
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('products/', views.product_list, name='product_list'),
+    path('inventory/', views.inventory_list, name='inventory_list'),
+    path('upload/', views.upload_products, name='upload_products'),
+    path('upload-file/', views.upload_file, name='upload_file'),
+    path('barcodes/<str:data>.<str:fmt>', views.barcode_image, name='barcode_image'),
+]
+
+
+def consume_context(request, template_name, context=None, *args, **kwargs):
+    # Stand-in for render(): evaluate everything a template would iterate,
+    # so the benchmark measures data access rather than template files.
+    def evaluate(value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                evaluate(key)
+                evaluate(item)
+        elif hasattr(value, '__iter__') and not isinstance(value, (str, bytes)):
+            for item in value:
+                evaluate(item)
+    evaluate(context or {})
+    return HttpResponse()
+
+
+def consume(response):
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+@override_settings(ROOT_URLCONF=__name__, PRODUCT_INLINE_REPORT_ROWS=10 ** 9, PRODUCT_BARCODE_WORKERS=1)
+class ProductBenchmarks(TestCase):
+    results = []
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        cls.report()
+
+    @classmethod
+    def setUpTestData(cls):
+        size = BENCHMARK_SIZE
+        cls.admin_user = User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+        users = User.objects.bulk_create([User(username=f'user{i}') for i in range(USER_COUNT)])
+
+        Product.objects.bulk_create([
+            Product(
+                hostname=f'PC{i:06}', host_name_category='Desktop' if i % 2 else 'Laptop',
+                serial_number=f'SN{i:09}', model_number=f'M{i % 50}', item_type='CPU',
+                department='IT', token=token, user=users[i % USER_COUNT],
+            )
+            for i, token in enumerate(Product.generate_tokens(size))
+        ], batch_size=1000)
+        products = list(Product.objects.only('id', 'hostname').order_by('id'))
+
+        TransferLog.objects.bulk_create([
+            TransferLog(product=products[i % size], sender=users[i % USER_COUNT],
+                        receiver=users[(i + 1) % USER_COUNT])
+            for i in range(size * 2)
+        ], batch_size=1000)
+
+        assignments = HostnameAssignment.objects.bulk_create([
+            HostnameAssignment(hostname=product.hostname, product=product, user=users[i % USER_COUNT],
+                               status='Assigned' if i % 4 else 'Unassigned')
+            for i, product in enumerate(products)
+        ], batch_size=1000)
+        today = now().date()
+        for i, assignment in enumerate(assignments):
+            assignment.assigned_date = today - timedelta(days=i % 365)
+        HostnameAssignment.objects.bulk_update(assignments, ['assigned_date'], batch_size=1000)
+
+        invoices = StockInvoice.objects.bulk_create([
+            StockInvoice(supplier_name=f'Supplier {i % 30}', invoice_no=f'INV{i:07}', received_by=users[i % USER_COUNT])
+            for i in range(max(1, size // 20))
+        ], batch_size=1000)
+        StockReceive.objects.bulk_create([
+            StockReceive(invoice=invoice, item_category='Laptop', quantity=j + 1, unit_of_measure='pcs',
+                         unit_price=Decimal('1000.00'), total_amount=Decimal('1000.00') * (j + 1))
+            for invoice in invoices for j in range(ITEMS_PER_INVOICE)
+        ], batch_size=1000)
+
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+
+    def benchmark(self, name, func):
+        max_queries, max_seconds = BUDGETS[name]
+        max_seconds *= TIME_FACTOR * max(1, BENCHMARK_SIZE / 10000)
+        if name in BATCHED_SCENARIOS:
+            max_queries = int(max_queries * max(1, BENCHMARK_SIZE / 10000))
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+        self.results.append((name, len(queries), elapsed))
+        self.assertLessEqual(len(queries), max_queries, f"{name} issued {len(queries)} queries")
+        self.assertLessEqual(elapsed, max_seconds, f"{name} took {elapsed:.2f}s")
+        return result
+
+    @classmethod
+    def report(cls):
+        lines = [f"\nproducts benchmarks ({BENCHMARK_SIZE} products)"]
+        lines += [f"  {name:<28} {count:>7} queries {elapsed * 1000:>10.1f} ms" for name, count, elapsed in cls.results]
+        sys.stderr.write('\n'.join(lines) + '\n')
+
+    def test_product_list(self):
+        with mock.patch('products.views.render', consume_context):
+            response = self.benchmark('product_list', lambda: self.client.get(reverse('product_list')))
+        self.assertEqual(response.status_code, 200)
+
+    def test_inventory_list(self):
+        with mock.patch('products.views.render', consume_context):
+            last_id = Product.objects.order_by('-id').values_list('id', flat=True)[21]
+            url = reverse('inventory_list') + f'?after={last_id}'
+            response = self.benchmark('inventory_list', lambda: self.client.get(url))
+        self.assertEqual(response.status_code, 200)
+
+    def test_upload_products(self):
+        lines = ['serial_number,host_name_category,model_number,department']
+        half = UPLOAD_ROWS // 2
+        lines += [f'SN{i:09},Laptop,M{i % 50},HR' for i in range(half)]
+        lines += [f'NEW{i:09},Desktop,M{i % 50},HR' for i in range(half)]
+        upload = SimpleUploadedFile('products.csv', '\n'.join(lines).encode(), content_type='text/csv')
+
+        response = self.benchmark('upload_products', lambda: self.client.post(reverse('upload_products'), {'file': upload}))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Product.objects.filter(serial_number__startswith='NEW').count(), half)
+
+    def test_reupload_products(self):
+        lines = ['serial_number,host_name_category,model_number,department']
+        lines += [f'SN{i:09},Laptop,M{i % 50},HR' for i in range(UPLOAD_ROWS)]
+        self.client.post(reverse('upload_products'), {'file': SimpleUploadedFile('products.csv', '\n'.join(lines).encode())})
+        changed = UPLOAD_ROWS // 250
+        for i in range(changed):
+            lines[1 + i * 250] = f'SN{i * 250:09},Laptop,M{i % 50},Finance'
+        upload = SimpleUploadedFile('products.csv', '\n'.join(lines).encode(), content_type='text/csv')
+
+        response = self.benchmark('reupload_products', lambda: self.client.post(reverse('upload_products'), {'file': upload}))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Product.objects.filter(department='Finance').count(), changed)
+
+    def test_transfer_to(self):
+        product = Product.objects.order_by('id').first()
+        receiver = User.objects.get(username='user1')
+        self.benchmark('transfer_to', lambda: product.transfer_to(receiver))
+
+    def test_edit_product(self):
+        product = Product.objects.order_by('id').first()
+        product.department = 'Finance'
+        self.benchmark('edit_product', product.save)
+        self.assertEqual(Product.objects.get(pk=product.pk).department, 'Finance')
+
+    def test_resave_product(self):
+        product = Product.objects.order_by('id').first()
+        product.save()  # seeded products have no barcode yet
+        self.benchmark('resave_product', product.save)
+
+    def test_edit_assignment(self):
+        # Editing an assignment without changing its hostname leaves the product alone.
+        assignment = HostnameAssignment.objects.select_related('product').filter(status='Assigned').first()
+        assignment.user = User.objects.get(username='user2')
+        self.benchmark('edit_assignment', assignment.save)
+
+    def test_bulk_transfer(self):
+        url = reverse('admin:products_product_changelist')
+        receiver = User.objects.get(username='user1')
+        data = {
+            'action': 'transfer_selected', 'select_across': '1', 'index': 0, 'receiver': receiver.pk,
+            '_selected_action': self.model_ids('product'),
+        }
+        response = self.benchmark('bulk_transfer', lambda: self.client.post(url, data))
+        self.assertEqual(response.status_code, 302)
+
+    def changelist(self, name, model):
+        url = reverse(f'admin:products_{model}_changelist')
+        response = self.benchmark(name, lambda: self.client.get(url))
+        self.assertEqual(response.status_code, 200)
+
+    def test_product_changelist(self):
+        self.changelist('product_changelist', 'product')
+
+    def test_assignment_changelist(self):
+        self.changelist('assignment_changelist', 'hostnameassignment')
+
+    def test_invoice_changelist(self):
+        self.changelist('invoice_changelist', 'stockinvoice')
+
+    def test_receive_changelist(self):
+        self.changelist('receive_changelist', 'stockreceive')
+
+    def action(self, name, model, action, select_across=True):
+        url = reverse(f'admin:products_{model}_changelist')
+        ids = self.model_ids(model)
+        data = {'action': action, '_selected_action': ids, 'select_across': '1' if select_across else '0', 'index': 0}
+        response = self.benchmark(name, lambda: consume(self.client.post(url, data)))
+        self.assertEqual(response.status_code, 200)
+
+    def model_ids(self, model):
+        model_class = {'product': Product, 'hostnameassignment': HostnameAssignment}[model]
+        return list(model_class.objects.order_by('id').values_list('id', flat=True)[:500])
+
+    def test_download_transfer_report(self):
+        self.action('download_transfer_report', 'product', 'download_transfer_report')
+
+    def test_product_export_as_pdf(self):
+        self.action('product_export_as_pdf', 'product', 'export_as_pdf')
+
+    def test_assignment_export_as_pdf(self):
+        self.action('assignment_export_as_pdf', 'hostnameassignment', 'export_as_pdf', select_across=False)
+
+    def test_download_assigned(self):
+        self.action('download_assigned', 'hostnameassignment', 'download_assigned')
+
+    def test_download_unassigned(self):
+        self.action('download_unassigned', 'hostnameassignment', 'download_unassigned')
@@ -96,4 +96,12 @@ def export_action_form_factory(formats):
             label=_('Format'), choices=formats, required=False)
     _ExportActionForm.__name__ = str('ExportActionForm')
 
-    return _ExportActionForm
\ No newline at end of file
+    return _ExportActionForm
+
+
+class TransferActionForm(ActionForm):
+    """
+    Action form with a receiver field for the bulk transfer action.
+    """
+    receiver = forms.ModelChoiceField(
+        label=_('Transfer to'), queryset=User.objects.order_by('username'), required=False)
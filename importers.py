@@ -0,0 +1,281 @@
+import hashlib
+import itertools
+from contextlib import ExitStack
+from datetime import date, datetime
+
+import pandas as pd
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.timezone import now
+from openpyxl import load_workbook
+from rest_framework.utils import json
+
+from .barcodes import barcode_pool, render_barcodes
+from .models import Product
+
+
+# Columns we accept from an uploaded sheet, in Product field order.
+IMPORT_FIELDS = Product.IMPORT_FIELDS
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def get_chunk_size():
+    return getattr(settings, 'PRODUCT_IMPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def get_inline_import_size():
+    # Uploads larger than this many bytes are imported by a background job.
+    return getattr(settings, 'PRODUCT_INLINE_IMPORT_BYTES', 1024 * 1024)
+
+
+class UnsupportedFileFormat(Exception):
+    pass
+
+
+SHEET_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+
+
+def check_sheet_format(file):
+    if not file.name.lower().endswith(SHEET_EXTENSIONS):
+        raise UnsupportedFileFormat(file.name)
+
+
+def _is_import_column(name):
+    return str(name).strip() in IMPORT_FIELDS
+
+
+def _cell_text(value):
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def _frame(rows, columns):
+    return pd.DataFrame(rows, columns=columns, dtype=object)
+
+
+def _read_xlsx_chunks(file, chunk_size):
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        wanted = [(index, str(name).strip()) for index, name in enumerate(header)
+                  if name is not None and _is_import_column(name)]
+        columns = [name for _, name in wanted]
+        batch = []
+        for row in rows:
+            batch.append([_cell_text(row[index]) if index < len(row) else None for index, _ in wanted])
+            if len(batch) == chunk_size:
+                yield _frame(batch, columns)
+                batch = []
+        yield _frame(batch, columns)
+    finally:
+        workbook.close()
+
+
+def read_sheet_chunks(file, chunk_size=None):
+    """
+    Yield an uploaded CSV or Excel sheet as DataFrames of at most
+    ``chunk_size`` rows holding only the IMPORT_FIELDS columns.
+
+    CSV is parsed incrementally and .xlsx is walked with openpyxl's
+    read-only row iterator, so memory use is bounded by the chunk size
+    rather than the file size. Legacy .xls has no streaming reader and is
+    loaded whole. Large uploads already arrive spooled to a temporary file
+    (Django's FILE_UPLOAD_MAX_MEMORY_SIZE), so nothing here reads the whole
+    upload into memory.
+    """
+    check_sheet_format(file)
+    chunk_size = chunk_size or get_chunk_size()
+    name = file.name.lower()
+    # Everything is read as text so serial numbers like 000123 keep their zeros.
+    if name.endswith('.csv'):
+        yield from pd.read_csv(file, dtype=str, usecols=_is_import_column, chunksize=chunk_size)
+    elif name.endswith('.xlsx'):
+        yield from _read_xlsx_chunks(file, chunk_size)
+    elif name.endswith('.xls'):
+        df = pd.read_excel(file, dtype=str, usecols=_is_import_column)
+        for start in range(0, max(len(df), 1), chunk_size):
+            yield df.iloc[start:start + chunk_size]
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.errors = []  # (row number, message)
+
+    def add_error(self, row_number, message):
+        self.errors.append((row_number, message))
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def summary(self):
+        return (f"{self.created} created, {self.updated} updated, {self.unchanged} unchanged, "
+                f"{len(self.errors)} rows skipped")
+
+
+def _import_columns(df):
+    names = {str(name).strip() for name in df.columns}
+    return [name for name in IMPORT_FIELDS if name in names]
+
+
+def _prepare_frame(df, columns, first_row):
+    """
+    Normalise one frame of the upload column-wise and return its records.
+    Each record carries its spreadsheet row number (header is row 1).
+    """
+    df = df.rename(columns=lambda name: str(name).strip())
+    frame = df.reindex(columns=columns).astype('string')
+    frame = frame.apply(lambda column: column.str.strip())
+    frame = frame.mask(frame == '')
+    frame = frame.astype(object).where(frame.notna(), None)
+    frame['_row'] = range(first_row, first_row + len(frame))
+    return frame.to_dict('records')
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def row_fingerprint(columns, row):
+    """
+    Content hash of one normalised sheet row. A product whose stored
+    fingerprint matches was imported from an identical row and is skipped.
+    """
+    source = json.dumps([[name, row[name]] for name in columns], default=str)
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def import_products(sheet, user=None, update_existing=True, chunk_size=None, progress=None, skip_rows=0):
+    """
+    Create or update products in batches from a pandas DataFrame, or from an
+    iterable of DataFrames such as read_sheet_chunks() yields.
+
+    Rows are matched on ``serial_number``. Invalid rows are collected in the
+    returned ``ImportResult`` instead of aborting the whole upload, and rows
+    identical to the last import of that serial number are skipped.
+
+    Each batch is committed on its own, so a failed import keeps the batches
+    before the failure. ``progress(rows_done, None)`` is called after each
+    commit; passing the last reported count back as ``skip_rows`` resumes
+    after it without reading those rows from the database again. Skipped
+    rows still take part in the duplicate serial number check.
+    """
+    chunk_size = chunk_size or get_chunk_size()
+    result = ImportResult()
+    frames = iter([sheet] if isinstance(sheet, pd.DataFrame) else sheet)
+    first = next(frames, None)
+    columns = _import_columns(first) if first is not None else []
+    if 'serial_number' not in columns:
+        result.add_error(1, "Missing 'serial_number' column.")
+        return result
+
+    fields = {name: Product._meta.get_field(name) for name in columns}
+    # Only validate what the sheet provides; missing columns keep their defaults.
+    unchecked = [field.name for field in Product._meta.fields if field.name not in fields]
+    update_fields = [name for name in columns if name != 'serial_number'] + ['import_fingerprint', 'updated_at']
+
+    seen = set()
+    done = 0
+    next_row = 2
+    with ExitStack() as stack:
+        pool = barcode_pool()
+        if pool is not None:
+            stack.enter_context(pool)
+        for frame in itertools.chain([first], frames):
+            records = _prepare_frame(frame, columns, next_row)
+            next_row += len(records)
+            for chunk in _chunks(records, chunk_size):
+                skipped = min(max(skip_rows - done, 0), len(chunk))
+                # Rows imported by an earlier run still count for duplicate checks.
+                seen.update(row['serial_number'] for row in chunk[:skipped] if row['serial_number'])
+                done += len(chunk)
+                if skipped == len(chunk):
+                    continue
+                with transaction.atomic():
+                    products = _import_chunk(
+                        chunk[skipped:], result, seen, user, update_existing, fields, unchecked, update_fields, chunk_size,
+                    )
+                # Rendered after the commit so CPU-bound PNG work never holds
+                # the write lock, and per batch so only one batch of products
+                # is held in memory.
+                render_barcodes(products, pool=pool)
+                if progress is not None:
+                    progress(done, None)
+
+    return result
+
+
+def _import_chunk(chunk, result, seen, user, update_existing, fields, unchecked, update_fields, batch_size):
+    serials = [row['serial_number'] for row in chunk if row['serial_number']]
+    existing = Product.objects.in_bulk(serials, field_name='serial_number')
+    to_create, to_update, to_render = [], [], []
+    timestamp = now()
+
+    for row in chunk:
+        row_number = row.pop('_row')
+        serial = row['serial_number']
+        if not serial:
+            result.add_error(row_number, "Missing serial number.")
+            continue
+        if serial in seen:
+            result.add_error(row_number, f"Duplicate serial number {serial} in file.")
+            continue
+        seen.add(serial)
+
+        product = existing.get(serial)
+        if product is not None and not update_existing:
+            result.add_error(row_number, f"Serial number {serial} already exists.")
+            continue
+        fingerprint = row_fingerprint(fields, row)
+        if product is not None and product.import_fingerprint == fingerprint:
+            result.unchanged += 1
+            # A run that failed between commit and rendering left this one without a barcode.
+            if product.barcode_is_stale():
+                to_render.append(product)
+            continue
+
+        values = {
+            name: '' if value is None and not fields[name].null else value
+            for name, value in row.items()
+        }
+        if product is None:
+            product = Product(user=user, last_updated_hourly=timestamp)
+        for name, value in values.items():
+            setattr(product, name, value)
+        product.import_fingerprint = fingerprint
+
+        try:
+            product.clean_fields(exclude=unchecked)
+        except ValidationError as e:
+            result.add_error(row_number, "; ".join(
+                f"{name}: {' '.join(messages)}" for name, messages in e.message_dict.items()
+            ))
+            continue
+
+        if product.pk is None:
+            to_create.append(product)
+        else:
+            product.updated_at = timestamp
+            to_update.append(product)
+
+    if to_create:
+        for product, token in zip(to_create, Product.generate_tokens(len(to_create))):
+            product.token = token
+        Product.objects.bulk_create(to_create, batch_size=batch_size)
+        result.created += len(to_create)
+    if to_update:
+        Product.objects.bulk_update(to_update, update_fields, batch_size=batch_size)
+        result.updated += len(to_update)
+    return to_create + to_update + to_render
@@ -0,0 +1,158 @@
+import csv
+import io
+import logging
+import os
+import tempfile
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.utils.timezone import now
+
+from .models import HostnameAssignment, Job, TransferLog
+
+
+logger = logging.getLogger(__name__)
+
+UPLOADS_DIR = 'jobs/uploads'
+
+JOBS = {}
+
+
+def register(name):
+    def decorator(func):
+        JOBS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, user=None, **kwargs):
+    if name not in JOBS:
+        raise KeyError(f"Unknown job {name!r}.")
+    return Job.objects.create(name=name, kwargs=kwargs, user=user if user and user.is_authenticated else None)
+
+
+def get_lease_timeout():
+    # A running job without a heartbeat for this long is assumed to belong
+    # to a worker that died, and is queued again.
+    return timedelta(seconds=getattr(settings, 'PRODUCT_JOB_LEASE_SECONDS', 3600))
+
+
+def requeue_stale():
+    stale = Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=now() - get_lease_timeout())
+    return stale.update(status=Job.QUEUED, started_at=None, heartbeat_at=None)
+
+
+def claim_next():
+    """
+    Mark the oldest queued job as running and return it, or None when the
+    queue is empty. The conditional UPDATE makes the claim atomic, so any
+    number of workers can poll the same table.
+    """
+    requeue_stale()
+    while True:
+        job = Job.objects.filter(status=Job.QUEUED).order_by('created_at', 'id').first()
+        if job is None:
+            return None
+        started_at = now()
+        claimed = Job.objects.filter(pk=job.pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, started_at=started_at, heartbeat_at=started_at,
+        )
+        if claimed:
+            job.status, job.started_at, job.heartbeat_at = Job.RUNNING, started_at, started_at
+            return job
+
+
+def run(job):
+    try:
+        JOBS[job.name](job, **job.kwargs)
+        job.status = Job.DONE
+    except Exception as exc:
+        logger.exception("Job %s failed", job)
+        job.status = Job.FAILED
+        job.message = str(exc) or exc.__class__.__name__
+    job.finished_at = now()
+    job.save(update_fields=['status', 'message', 'result', 'finished_at'])
+    return job
+
+
+def retry(jobs):
+    """
+    Queue failed jobs again. Import jobs pick up from their recorded progress.
+    """
+    return jobs.filter(status=Job.FAILED).update(status=Job.QUEUED, message='', started_at=None, finished_at=None)
+
+
+def work_once():
+    close_old_connections()
+    job = claim_next()
+    if job is not None:
+        run(job)
+    return job
+
+
+def spool_upload(file):
+    """
+    Copy an uploaded file to storage so a worker can read it later.
+    """
+    return default_storage.save(f'{UPLOADS_DIR}/{uuid.uuid4().hex}-{os.path.basename(file.name)}', file)
+
+
+@register('import_products')
+def import_products_job(job, path, update_existing=True, user_id=None):
+    from .importers import import_products, read_sheet_chunks
+
+    user = User.objects.filter(pk=user_id).first() if user_id else None
+    # Batches are committed as they go, so a retried job resumes after the
+    # last one recorded in job.progress. The upload is kept until then.
+    with default_storage.open(path, 'rb') as file:
+        file.name = path
+        chunks = read_sheet_chunks(file)
+        try:
+            result = import_products(
+                chunks, user=user, update_existing=update_existing,
+                progress=job.set_progress, skip_rows=job.progress,
+            )
+        finally:
+            # Close the reader while its file is still open.
+            chunks.close()
+    default_storage.delete(path)
+    lines = [result.summary()] + [f"Row {row}: {error}" for row, error in result.errors]
+    job.message = '\n'.join(lines)
+
+
+def _save_result(job, filename, output):
+    output.seek(0)
+    job.result.save(filename, File(output), save=False)
+
+
+@register('assignment_report')
+def assignment_report_job(job, title, filename, ids, numbered=False):
+    from .reports import write_assignment_pdf
+
+    assignments = HostnameAssignment.objects.filter(pk__in=ids).order_by('-assigned_date')
+    with tempfile.TemporaryFile() as output:
+        write_assignment_pdf(output, title, assignments, numbered=numbered)
+        _save_result(job, filename, output)
+
+
+@register('transfer_report')
+def transfer_report_job(job, product_ids):
+    transfers = TransferLog.objects.filter(product_id__in=product_ids).values_list(
+        'product__hostname', 'sender__username', 'receiver__username', 'transferred_at',
+    )
+    # Rows go straight to a temporary file, so memory stays flat however
+    # many transfers the report holds.
+    with tempfile.TemporaryFile() as output:
+        text = io.TextIOWrapper(output, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        writer.writerow(['Host Name', 'Sender', 'Receiver', 'Transferred At'])
+        for row in transfers.iterator(chunk_size=2000):
+            writer.writerow(['N/A' if value is None else value for value in row])
+        text.flush()
+        _save_result(job, 'transfer_report.csv', output)
+        text.detach()
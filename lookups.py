@@ -0,0 +1,77 @@
+import pickle
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .cache import LRUCache
+from .models import Product
+
+
+MAX_LOOKUP_CODES = 1000
+
+# Hot tokens are answered from memory for a short while without a query;
+# a product edit can therefore take up to the TTL to show up here.
+token_cache = LRUCache(getattr(settings, 'PRODUCT_TOKEN_CACHE_SIZE', 10000))
+
+
+def get_token_cache_ttl():
+    return getattr(settings, 'PRODUCT_TOKEN_CACHE_TTL', 60)
+
+
+def lookup_products(codes, queryset=None):
+    """
+    Resolve scanned barcode payloads to products.
+
+    A payload is whatever Product.get_barcode_data() encoded: a serial
+    number, a model number or a token. Each key type is resolved with one
+    IN query, in that order of precedence, so a batch costs a fixed number
+    of queries however many codes it holds.
+
+    Returns ``(matches, missing)`` where ``matches`` maps each code to a
+    list of products (model numbers can match several).
+    """
+    # Cached products ignore any narrower queryset the caller passes.
+    use_cache = queryset is None
+    if queryset is None:
+        queryset = Product.objects.all()
+    queryset = queryset.select_related('user')
+    codes = list(dict.fromkeys(code.strip() for code in codes if code and code.strip()))
+    matches = {}
+
+    # Tokens are longer than any serial or model number can be, so answering
+    # them from the cache first keeps the order of precedence.
+    now = time.monotonic()
+    if use_cache:
+        for code in codes:
+            expires, pickled = token_cache.get(code, (0, None))
+            if expires > now:
+                # Stored pickled, so every hit gets its own instance.
+                matches[code] = [pickle.loads(pickled)]
+
+    remaining = [code for code in codes if code not in matches]
+    if remaining:
+        for product in queryset.filter(serial_number__in=remaining):
+            matches[product.serial_number] = [product]
+
+    fetched_by_token = []
+    remaining = [code for code in remaining if code not in matches]
+    if remaining:
+        for product in queryset.filter(token__in=remaining):
+            matches[product.token] = [product]
+            fetched_by_token.append(product)
+
+    remaining = [code for code in remaining if code not in matches]
+    if remaining:
+        for product in queryset.filter(model_number__in=remaining).order_by('id'):
+            matches.setdefault(product.model_number, []).append(product)
+
+    # Cached copies already carry their users, so they are skipped here.
+    products = [product for found in matches.values() for product in found]
+    prefetch_related_objects(products, Prefetch('users', queryset=User.objects.only('id', 'username')))
+    if use_cache:
+        for product in fetched_by_token:
+            token_cache.set(product.token, (now + get_token_cache_ttl(), pickle.dumps(product)))
+    missing = [code for code in codes if code not in matches]
+    return matches, missing
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ...models import HostnameAssignment
+
+
+class Command(BaseCommand):
+    help = "Link existing hostname assignments to the product carrying their hostname."
+
+    def handle(self, *args, **options):
+        updated = HostnameAssignment.backfill_products()
+        self.stdout.write(self.style.SUCCESS(f"Linked {updated} hostname assignments to products."))
@@ -0,0 +1,75 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Hit one or more URLs with many concurrent clients and report throughput and latency, "
+        "e.g. the same page on the WSGI and the ASGI deployment."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+')
+        parser.add_argument('--clients', type=int, default=200, help="Concurrent clients (default 200).")
+        parser.add_argument('--requests', type=int, default=2000, help="Requests per URL (default 2000).")
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--cookie', help="Cookie header to send, e.g. a logged-in sessionid.")
+
+    def handle(self, *args, **options):
+        if options['clients'] < 1 or options['requests'] < 1:
+            raise CommandError("--clients and --requests must be positive.")
+        failed = 0
+        for url in options['urls']:
+            result = self.run(url, options)
+            self.report(url, result)
+            failed += len(result[2])
+        if failed:
+            raise CommandError(f"{failed} requests failed.")
+
+    def run(self, url, options):
+        headers = {'Cookie': options['cookie']} if options['cookie'] else {}
+        remaining = iter(range(options['requests']))
+        lock = threading.Lock()
+        latencies, errors = [], []
+
+        def client():
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        return
+                started = time.perf_counter()
+                try:
+                    with urlopen(Request(url, headers=headers), timeout=options['timeout']) as response:
+                        response.read()
+                except Exception as exc:
+                    # Anything a request raises, not only HTTP and socket
+                    # errors, is a failed request rather than a dead client.
+                    with lock:
+                        errors.append(exc)
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['clients']) as pool:
+            futures = [pool.submit(client) for _ in range(options['clients'])]
+        # A client that died outside a request is reported, not swallowed.
+        errors.extend(future.exception() for future in futures if future.exception())
+        return time.perf_counter() - started, latencies, errors
+
+    def report(self, url, result):
+        elapsed, latencies, errors = result
+        self.stdout.write(url)
+        self.stdout.write(f"  {len(latencies)} ok, {len(errors)} failed in {elapsed:.1f}s "
+                          f"({len(latencies) / elapsed:.1f} req/s)")
+        if len(latencies) > 1:
+            cuts = statistics.quantiles(latencies, n=100)
+            self.stdout.write(f"  latency p50 {cuts[49] * 1000:.0f} ms, p95 {cuts[94] * 1000:.0f} ms, "
+                              f"p99 {cuts[98] * 1000:.0f} ms, max {max(latencies) * 1000:.0f} ms")
+        if errors:
+            self.stdout.write(self.style.WARNING(f"  first error: {errors[0]}"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ...search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Create the product and assignment search indexes and refill them from the tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        rebuild_search_index(options['database'])
+        self.stdout.write(self.style.SUCCESS("Rebuilt the search index."))
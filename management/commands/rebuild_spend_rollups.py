@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ...models import SpendRollup
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily and monthly spend rollups from the stock receive line items."
+
+    def handle(self, *args, **options):
+        created = SpendRollup.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} spend rollups."))
@@ -0,0 +1,43 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from ...jobs import work_once
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (imports, reports) with a pool of worker threads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Jobs run at the same time (default 2).")
+        parser.add_argument('--poll', type=float, default=2.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+
+        def worker():
+            try:
+                while not stop.is_set():
+                    job = work_once()
+                    if job is not None:
+                        self.stdout.write(f"{job}: {job.message.splitlines()[0] if job.message else ''}")
+                    elif options['once']:
+                        return
+                    else:
+                        stop.wait(options['poll'])
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            futures = [pool.submit(worker) for _ in range(options['workers'])]
+            try:
+                while not all(future.done() for future in futures):
+                    time.sleep(0.5)
+            except KeyboardInterrupt:
+                stop.set()
+        for future in futures:
+            future.result()
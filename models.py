@@ -1,14 +1,18 @@
-from django.db import models, IntegrityError
+from django.db import models, IntegrityError, router, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.fields.files import FieldFile
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.db.models.functions import Coalesce, TruncMonth
 from django.contrib.auth.models import User
+from django.urls import reverse
 from django.utils.timezone import now
-from io import BytesIO
-from django.core.files.base import ContentFile
 import uuid
-import barcode
-from barcode.writer import ImageWriter
+from decimal import Decimal
 import base64
 import hashlib
 from datetime import timedelta
+from .barcodes import attach_barcode
 
 
 class TransferLog(models.Model):
@@ -18,6 +22,11 @@ class TransferLog(models.Model):
     receiver = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='received_transfers')
     transferred_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'transferred_at']),
+        ]
+
     def __str__(self):
         return f"#{self.id}: {self.product.host_name_category} from {self.sender} to {self.receiver} on {self.transferred_at}"
 
@@ -33,7 +42,7 @@ class ProductGroup(models.Model):
 class Product(models.Model):
     id = models.AutoField(primary_key=True)
     unique_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, verbose_name="Unique ID")
-    hostname = models.CharField(max_length=255, blank=True, null=True, verbose_name="Hostname")
+    hostname = models.CharField(max_length=255, blank=True, null=True, db_index=True, verbose_name="Hostname")
     host_name_category = models.CharField(max_length=10,choices=[("Desktop", "Desktop"), ("Laptop", "Laptop")],verbose_name="Host Name Category")
     model_number = models.CharField(max_length=13, null=True, blank=True, verbose_name="Model Number")
     serial_number = models.CharField(max_length=13, unique=True, null=True, blank=True, verbose_name="Serial Number")
@@ -58,38 +67,153 @@ class Product(models.Model):
     department = models.CharField(max_length=100, null=True, blank=True, verbose_name="Department")
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, verbose_name="Created By")
     users = models.ManyToManyField(User, blank=True, verbose_name="Assigned Users", related_name="assigned_products")
-    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At")
-    updated_at = models.DateTimeField(auto_now=True, verbose_name="Updated At")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="Created At")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Updated At")
     last_updated_hourly = models.DateTimeField(null=True, blank=True, verbose_name="Last Updated Hourly")
+    # Hash of the sheet row this product was last imported from; see importers.row_fingerprint().
+    import_fingerprint = models.CharField(max_length=64, blank=True, editable=False, verbose_name="Import Fingerprint")
 
     def get_transfer_history(self):
         return TransferLog.objects.filter(product=self).order_by('-transferred_at')
 
+    # Fields that make up the Code128 payload; the barcode only needs
+    # re-rendering when one of these changes.
+    BARCODE_FIELDS = ('serial_number', 'model_number', 'token')
+
+    # Columns accepted from an uploaded sheet, in field order.
+    IMPORT_FIELDS = (
+        'hostname', 'host_name_category', 'model_number', 'serial_number',
+        'lan_ip', 'wan_ip', 'mac_address', 'location', 'item_type',
+        'number_id', 'department',
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if all(name in field_names for name in (*cls.BARCODE_FIELDS, 'barcode')):
+            instance.mark_barcode_rendered()
+        instance.mark_saved()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        # Only the reloaded fields are clean again; loading a deferred field
+        # goes through here too and must not discard other unsaved edits.
+        self.mark_saved(fields)
+
+    def _tracked_values(self):
+        # Deferred fields are left out; assigning one makes it dirty.
+        values = {}
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname not in self.__dict__:
+                continue
+            value = getattr(self, field.attname)
+            values[field.name] = value.name if isinstance(value, FieldFile) else value
+        return values
+
+    def mark_saved(self, update_fields=None):
+        values = self._tracked_values()
+        saved = getattr(self, '_saved_values', None)
+        if update_fields is None or saved is None:
+            self._saved_values = values
+        else:
+            names = (self._meta.get_field(name).name for name in update_fields)
+            saved.update((name, values[name]) for name in names if name in values)
+
+    def get_dirty_fields(self):
+        """
+        Names of the fields changed since the product was loaded or last
+        saved, or None for a product that is not in the database yet.
+        """
+        saved = getattr(self, '_saved_values', None)
+        if saved is None or self._state.adding:
+            return None
+        return {name for name, value in self._tracked_values().items() if name not in saved or saved[name] != value}
+
+    def get_barcode_data(self):
+        return self.serial_number or self.model_number or self.token or str(self.id)
+
+    def get_barcode_url(self, fmt='png'):
+        return reverse('barcode_image', kwargs={'data': self.get_barcode_data(), 'fmt': fmt})
+
+    def mark_barcode_rendered(self):
+        self._rendered_barcode_data = self.get_barcode_data() if self.barcode else None
+
+    def barcode_is_stale(self):
+        return getattr(self, '_rendered_barcode_data', None) != self.get_barcode_data()
+
+    # A uuid4 collision is practically impossible, so new tokens are inserted
+    # optimistically and the unique constraint catches the rare clash.
+    TOKEN_ATTEMPTS = 3
+
+    @staticmethod
+    def generate_tokens(count):
+        tokens = set()
+        while len(tokens) < count:
+            tokens.add(str(uuid.uuid4()))
+        return list(tokens)
+
     def save(self, *args, **kwargs):
-        if not self.token:
-            while True:
-                new_token = str(uuid.uuid4())
-                if not Product.objects.filter(token=new_token).exists():
-                    self.token = new_token
-                    break
-
-        barcode_data = self.serial_number or self.model_number or self.token or str(self.id)
-        if barcode_data:
-            barcode_class = barcode.get_barcode_class('code128')
-            barcode_instance = barcode_class(barcode_data, writer=ImageWriter())
-            buffer = BytesIO()
-            barcode_instance.write(buffer)
-            filename = f'barcode_{self.token}.png'
-            self.barcode.save(filename, ContentFile(buffer.getvalue()), save=False)
-
-        if not self.last_updated_hourly or (now() - self.last_updated_hourly) >= timedelta(hours=1):
-            self.last_updated_hourly = now()
-
-        try:
-            super().save(*args, **kwargs)
-        except IntegrityError:
+        generated_token = not self.token
+        if generated_token:
             self.token = str(uuid.uuid4())
+
+        update_fields = kwargs.get('update_fields')
+        tracked = False
+        if update_fields is not None:
+            update_fields = set(update_fields)
+        elif not kwargs.get('force_insert'):
+            # A plain save() of a loaded product only writes what changed.
+            update_fields = self.get_dirty_fields()
+            tracked = update_fields is not None
+
+        barcode_requested = tracked or update_fields is None or not update_fields.isdisjoint(self.BARCODE_FIELDS)
+        if barcode_requested and self.barcode_is_stale():
+            attach_barcode(self)
+            if update_fields is not None:
+                update_fields.add('barcode')
+
+        # A product edited outside the importer no longer matches its sheet row.
+        if self.import_fingerprint and (update_fields is None or not update_fields.isdisjoint(self.IMPORT_FIELDS)):
+            self.import_fingerprint = ''
+            if update_fields is not None:
+                update_fields.add('import_fingerprint')
+
+        if tracked:
+            if not update_fields:
+                return
+            update_fields.add('updated_at')
+        if tracked or update_fields is None or 'last_updated_hourly' in update_fields:
+            if not self.last_updated_hourly or (now() - self.last_updated_hourly) >= timedelta(hours=1):
+                self.last_updated_hourly = now()
+                if update_fields is not None:
+                    update_fields.add('last_updated_hourly')
+        if update_fields is not None:
+            kwargs['update_fields'] = update_fields
+
+        if not generated_token:
             super().save(*args, **kwargs)
+            self.mark_saved(kwargs.get('update_fields'))
+            return
+
+        using = kwargs.get('using') or router.db_for_write(Product, instance=self)
+        for attempt in range(1, self.TOKEN_ATTEMPTS + 1):
+            try:
+                if transaction.get_connection(using).in_atomic_block:
+                    # Keep the caller's transaction usable if the insert fails.
+                    with transaction.atomic(using=using):
+                        super().save(*args, **kwargs)
+                else:
+                    super().save(*args, **kwargs)
+                self.mark_saved(kwargs.get('update_fields'))
+                return
+            except IntegrityError:
+                # Only retry clashes on the token, not e.g. a duplicate serial number.
+                if attempt == self.TOKEN_ATTEMPTS or not Product.objects.using(using).filter(token=self.token).exists():
+                    raise
+                self.token = str(uuid.uuid4())
+                if self.barcode_is_stale():
+                    attach_barcode(self)
 
     def transfer_to(self, new_user):
         TransferLog.objects.create(
@@ -99,23 +223,47 @@ class Product(models.Model):
             transferred_at=now()
         )
         self.users.add(new_user)
-        self.save()
+        self.save(update_fields=['last_updated_hourly', 'updated_at'])
 
 
 class HostnameAssignment(models.Model):
     hostname = models.CharField(max_length=255, verbose_name="Hostname")
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+                                related_name='hostname_assignments', verbose_name="Product")
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Assigned User")
     assigned_date = models.DateField(auto_now_add=True, verbose_name="Assignment Date")
     unassigned_date = models.DateField(null=True, blank=True, verbose_name="Unassignment Date")
     status = models.CharField(max_length=20, choices=[('Assigned', 'Assigned'), ('Unassigned', 'Unassigned')])
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['hostname', 'status', 'assigned_date']),
+        ]
+
     def __str__(self):
         return f"{self.hostname} -> {self.user.username} ({self.status})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'hostname' in field_names:
+            instance._saved_hostname = instance.hostname
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        if fields is None or 'hostname' in fields:
+            self._saved_hostname = self.hostname
+
     def save(self, *args, **kwargs):
-        # Update the hostname field in the matching Product
-        try:
-            product = Product.objects.get(hostname=self.hostname)
+        # Link the assignment to the Product with its hostname, again whenever the
+        # hostname is edited, then keep the product's hostname in sync
+        hostname_changed = not self._state.adding and self.hostname != getattr(self, '_saved_hostname', None)
+        if self.product_id is None or hostname_changed:
+            self.product = Product.objects.filter(hostname=self.hostname).first()
+
+        product = self.product
+        if product is not None:
             if self.status == 'Assigned':
                 product.hostname = self.hostname
             elif self.status == 'Unassigned':
@@ -125,30 +273,33 @@ class HostnameAssignment(models.Model):
                 ).exclude(id=self.id)
                 if not active_assignments.exists():
                     product.hostname = None
-            product.save(update_fields=['hostname'])
-        except Product.DoesNotExist:
-            pass  # Optionally raise error or log
+            if 'hostname' in (product.get_dirty_fields() or ()):
+                product.save(update_fields=['hostname'])
 
         super().save(*args, **kwargs)
+        self._saved_hostname = self.hostname
 
     def is_active(self):
         return self.status == 'Assigned' and self.unassigned_date is None
 
+    def get_product(self):
+        if self.product_id is None:
+            return Product.objects.filter(hostname=self.hostname).first()
+        return self.product
+
     def generate_short_code(self):
-        try:
-            product = Product.objects.get(hostname=self.hostname)
-            if product.serial_number:
-                hash_object = hashlib.sha256(product.serial_number.encode())
-                return base64.b32encode(hash_object.digest()).decode()[:8]
-        except Product.DoesNotExist:
+        product = self.get_product()
+        if product is None:
             return None
-        
+        if product.serial_number:
+            hash_object = hashlib.sha256(product.serial_number.encode())
+            return base64.b32encode(hash_object.digest()).decode()[:8]
+
     def get_serial_number(self):
-        try:
-            product = Product.objects.get(hostname=self.hostname)
-            return product.serial_number
-        except Product.DoesNotExist:
-            return "N/A"    
+        product = self.get_product()
+        if product is None:
+            return "N/A"
+        return product.serial_number
 
     @staticmethod
     def get_current_hostname_assignment(hostname_str):
@@ -157,6 +308,15 @@ class HostnameAssignment(models.Model):
             status='Assigned'
         ).order_by('-assigned_date').first()
 
+    @classmethod
+    def backfill_products(cls):
+        """
+        Link assignments created before the product relation existed to the
+        product currently carrying their hostname. Returns the rows updated.
+        """
+        product_id = Product.objects.filter(hostname=OuterRef('hostname')).values('pk')[:1]
+        return cls.objects.filter(product__isnull=True).update(product=Subquery(product_id))
+
 
 
 #Stock Received
@@ -184,6 +344,14 @@ class HostnameAssignment(models.Model):
 #      return f"{self.quantity} {self.unit_of_measure} {self.invoice_no} of {self.item_category} from {self.supplier_name}"
 
 
+class StockInvoiceQuerySet(models.QuerySet):
+    def with_totals(self):
+        return self.annotate(
+            item_count=Count('items'),
+            amount_total=Coalesce(Sum('items__total_amount'), Decimal('0.00')),
+        )
+
+
 class StockInvoice(models.Model):
     supplier_name = models.CharField(max_length=255, verbose_name="Supplier Name")
     invoice_no = models.CharField(max_length=255, unique=True, verbose_name="Invoice Number")
@@ -191,14 +359,39 @@ class StockInvoice(models.Model):
     date_received = models.DateField(default=now, verbose_name="Date Received")
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    objects = StockInvoiceQuerySet.as_manager()
+
     def __str__(self):
         return f"Invoice {self.invoice_no} from {self.supplier_name}"
 
+    def save(self, *args, **kwargs):
+        previous = None
+        if self.pk is not None:
+            previous = StockInvoice.objects.filter(pk=self.pk).values('supplier_name', 'date_received').first()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if previous and (previous['supplier_name'], previous['date_received']) != (self.supplier_name, self.date_received):
+                # The invoice's items are rolled up under its supplier and date.
+                items = self.items.values('item_category', 'unit_of_measure').annotate(
+                    spend_quantity=Sum('quantity'), spend_amount=Sum('total_amount'),
+                ).order_by()
+                for item in items:
+                    SpendRollup.record(previous['date_received'], previous['supplier_name'], item['item_category'],
+                                       item['unit_of_measure'], -item['spend_quantity'], -item['spend_amount'])
+                    SpendRollup.record(self.date_received, self.supplier_name, item['item_category'],
+                                       item['unit_of_measure'], item['spend_quantity'], item['spend_amount'])
+
+    # StockInvoice.objects.with_totals() annotates these so lists of invoices
+    # don't query the line items once per row.
     def total_items(self):
+        if hasattr(self, 'item_count'):
+            return self.item_count
         return self.items.count()
 
     def total_amount(self):
-        return sum(item.total_amount for item in self.items.all())
+        if hasattr(self, 'amount_total'):
+            return self.amount_total
+        return self.items.aggregate(total=Coalesce(Sum('total_amount'), Decimal('0.00')))['total']
 
 
 class StockReceive(models.Model):
@@ -230,8 +423,143 @@ class StockReceive(models.Model):
     def save(self, *args, **kwargs):
         # Auto calculate total_amount before saving
         self.total_amount = self.unit_price * self.quantity
-        super().save(*args, **kwargs)
+        previous = None
+        if self.pk is not None:
+            previous = StockReceive.objects.filter(pk=self.pk).values(
+                'invoice__date_received', 'invoice__supplier_name', 'item_category', 'unit_of_measure',
+                'quantity', 'total_amount',
+            ).first()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if previous:
+                SpendRollup.record(previous['invoice__date_received'], previous['invoice__supplier_name'],
+                                   previous['item_category'], previous['unit_of_measure'],
+                                   -previous['quantity'], -previous['total_amount'])
+            self.record_spend()
+
+    def record_spend(self, sign=1):
+        SpendRollup.record(self.invoice.date_received, self.invoice.supplier_name, self.item_category,
+                           self.unit_of_measure, sign * self.quantity, sign * self.total_amount)
 
     def __str__(self):
         return f"{self.quantity} {self.unit_of_measure} of {self.item_category} - Invoice {self.invoice.invoice_no}"
 
+
+# A receiver rather than a delete() override so queryset deletes and
+# invoice cascades are rolled back out of the totals too.
+@receiver(post_delete, sender=StockReceive)
+def remove_stock_receive_spend(sender, instance, **kwargs):
+    instance.record_spend(sign=-1)
+
+
+class SpendRollup(models.Model):
+    """
+    Pre-aggregated procurement spend per day and per month, by supplier,
+    item category and unit of measure. Kept current by StockReceive and
+    StockInvoice saves; rebuild() recomputes it from the line items.
+    """
+    DAY = 'day'
+    MONTH = 'month'
+    PERIOD_CHOICES = [(DAY, 'Day'), (MONTH, 'Month')]
+
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES, verbose_name="Period")
+    period_start = models.DateField(verbose_name="Period Start")
+    supplier_name = models.CharField(max_length=255, verbose_name="Supplier Name")
+    item_category = models.CharField(max_length=20, choices=StockReceive.CATEGORY_CHOICES, verbose_name="Item Category")
+    unit_of_measure = models.CharField(max_length=10, choices=StockReceive.UNIT_CHOICES, verbose_name="Unit of Measure (UoM)")
+    quantity = models.BigIntegerField(default=0, verbose_name="Quantity")
+    amount = models.DecimalField(max_digits=16, decimal_places=2, default=0, verbose_name="Amount (Ksh.)")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period', 'period_start', 'supplier_name', 'item_category', 'unit_of_measure'],
+                name='unique_spend_rollup',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.supplier_name} {self.item_category} ({self.period} of {self.period_start}): {self.amount}"
+
+    @classmethod
+    def record(cls, date, supplier_name, item_category, unit_of_measure, quantity, amount):
+        for period, period_start in ((cls.DAY, date), (cls.MONTH, date.replace(day=1))):
+            rollup, _ = cls.objects.get_or_create(
+                period=period, period_start=period_start, supplier_name=supplier_name,
+                item_category=item_category, unit_of_measure=unit_of_measure,
+            )
+            # F() expressions keep concurrent receipts from losing updates.
+            cls.objects.filter(pk=rollup.pk).update(quantity=F('quantity') + quantity, amount=F('amount') + amount)
+
+    @classmethod
+    def rebuild(cls):
+        keys = ('invoice__supplier_name', 'item_category', 'unit_of_measure')
+        with transaction.atomic():
+            cls.objects.all().delete()
+            rollups = []
+            for period, period_start in ((cls.DAY, F('invoice__date_received')), (cls.MONTH, TruncMonth('invoice__date_received'))):
+                rows = StockReceive.objects.annotate(period_start=period_start).values('period_start', *keys).annotate(
+                    spend_quantity=Sum('quantity'), spend_amount=Sum('total_amount'),
+                ).order_by()
+                rollups.extend(
+                    cls(period=period, period_start=row['period_start'], supplier_name=row['invoice__supplier_name'],
+                        item_category=row['item_category'], unit_of_measure=row['unit_of_measure'],
+                        quantity=row['spend_quantity'], amount=row['spend_amount'])
+                    for row in rows
+                )
+            cls.objects.bulk_create(rollups, batch_size=500)
+        return len(rollups)
+
+
+
+def job_result_path(instance, filename):
+    # Results are only served through the job download views; the random
+    # directory keeps them from being guessed if MEDIA_ROOT is public.
+    return f'jobs/results/{uuid.uuid4().hex}/{filename}'
+
+
+class Job(models.Model):
+    """
+    A unit of background work, queued in the database and picked up by
+    ``manage.py run_jobs``. See jobs.py for the registered job names.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=100, verbose_name="Job")
+    kwargs = models.JSONField(default=dict, blank=True, verbose_name="Arguments")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED, verbose_name="Status")
+    progress = models.PositiveIntegerField(default=0, verbose_name="Progress")
+    total = models.PositiveIntegerField(null=True, blank=True, verbose_name="Total")
+    message = models.TextField(blank=True, verbose_name="Message")
+    result = models.FileField(upload_to=job_result_path, blank=True, verbose_name="Result File")
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Requested By")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Started At")
+    # Refreshed by the worker while the job runs; see jobs.claim_next().
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="Last Heartbeat")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Finished At")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.name} ({self.status})"
+
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    def set_progress(self, progress, total=None):
+        self.progress = progress
+        if total is not None:
+            self.total = total
+        self.heartbeat_at = now()
+        Job.objects.filter(pk=self.pk).update(progress=self.progress, total=self.total, heartbeat_at=self.heartbeat_at)
+
+    def is_visible_to(self, user):
+        return user.is_staff or (self.user_id is not None and self.user_id == user.pk)
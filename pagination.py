@@ -0,0 +1,144 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.utils import json
+
+
+# Below this estimate an exact COUNT(*) is cheap and more useful.
+EXACT_COUNT_THRESHOLD = 10000
+
+
+def approximate_count(queryset):
+    """
+    Return a row count estimate from the query planner on PostgreSQL, or
+    an exact count elsewhere and for small results.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    estimate = int(plan[0]['Plan']['Plan Rows'])
+    if estimate < EXACT_COUNT_THRESHOLD:
+        return queryset.count()
+    return estimate
+
+
+class ApproximateCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        return approximate_count(self.object_list)
+
+
+class ApproximateCountAdminMixin:
+    """
+    Opt-in for admin changelists: with PRODUCT_ADMIN_APPROXIMATE_COUNTS
+    enabled, page counts come from the planner estimate and the extra
+    unfiltered COUNT(*) is skipped.
+    """
+
+    @property
+    def show_full_result_count(self):
+        return not getattr(settings, 'PRODUCT_ADMIN_APPROXIMATE_COUNTS', False)
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        if getattr(settings, 'PRODUCT_ADMIN_APPROXIMATE_COUNTS', False):
+            return ApproximateCountPaginator(queryset, per_page, orphans, allow_empty_first_page)
+        return super().get_paginator(request, queryset, per_page, orphans, allow_empty_first_page)
+
+
+class CursorPage:
+    """
+    A page of CursorPaginator results. Pages have no numbers: templates link
+    to ``?after=<next_cursor>`` and ``?before=<previous_cursor>``, which is
+    what keeps every page a keyset query.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+
+class CursorPaginator:
+    """
+    Keyset pagination on a unique, indexed integer column: each page is
+    ``WHERE key > cursor ORDER BY key LIMIT n`` so page N costs the same as
+    page 1 and no COUNT(*) is needed.
+    """
+
+    def __init__(self, queryset, per_page, key='id'):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.key = key
+
+    def get_page(self, after=None, before=None):
+        return self._page(list(self._rows(after, before)), after, before)
+
+    async def aget_page(self, after=None, before=None):
+        return self._page([row async for row in self._rows(after, before)], after, before)
+
+    def _rows(self, after, before):
+        key = self.key
+        if before is not None:
+            return self.queryset.filter(**{f'{key}__lt': before}).order_by(f'-{key}')[:self.per_page + 1]
+        queryset = self.queryset.order_by(key)
+        if after is not None:
+            queryset = queryset.filter(**{f'{key}__gt': after})
+        return queryset[:self.per_page + 1]
+
+    def _page(self, rows, after, before):
+        key = self.key
+        has_more = len(rows) > self.per_page
+        if before is not None:
+            rows = rows[:self.per_page][::-1]
+            return CursorPage(
+                rows,
+                next_cursor=getattr(rows[-1], key) if rows else None,
+                previous_cursor=getattr(rows[0], key) if rows and has_more else None,
+            )
+        rows = rows[:self.per_page]
+        return CursorPage(
+            rows,
+            next_cursor=getattr(rows[-1], key) if rows and has_more else None,
+            previous_cursor=getattr(rows[0], key) if rows and after is not None else None,
+        )
+
+
+async def aget_page(paginator, number):
+    """
+    Paginator.get_page() for async views: the count and the page's rows are
+    fetched with the async ORM, so the page can be rendered without queries.
+    """
+    paginator.count = await paginator.object_list.acount()
+    page = paginator.get_page(number)
+    page.object_list = [item async for item in page.object_list]
+    return page
+
+
+def parse_cursor(value):
+    try:
+        return int(value) if value not in (None, '') else None
+    except ValueError:
+        return None
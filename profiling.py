@@ -0,0 +1,237 @@
+"""
+Sampling request profiler.
+
+Add ``products.profiling.ProfilingMiddleware`` to MIDDLEWARE to turn it on.
+A random PRODUCT_PROFILING_SAMPLE_RATE share of requests (default 1%) records
+its query count, SQL time, repeated queries, view time and template render
+time. The other requests only pay for one random() call, which keeps the
+overhead well under 1% in production.
+
+Samples are kept in a per-process ring buffer of PRODUCT_PROFILING_BUFFER_SIZE
+entries. The staff-only page at profiling/ lists the slowest endpoints.
+"""
+import random
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+from django.utils.timezone import now
+
+
+def get_sample_rate():
+    return getattr(settings, 'PRODUCT_PROFILING_SAMPLE_RATE', 0.01)
+
+
+def get_buffer_size():
+    return getattr(settings, 'PRODUCT_PROFILING_BUFFER_SIZE', 1000)
+
+
+class RingBuffer:
+    """Thread-safe buffer that keeps the last ``max_entries`` items."""
+
+    def __init__(self, max_entries):
+        self._entries = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def append(self, item):
+        with self._lock:
+            self._entries.append(item)
+
+    def items(self):
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+samples = RingBuffer(get_buffer_size())
+
+
+class RequestProfile:
+    def __init__(self, endpoint, method):
+        self.endpoint = endpoint
+        self.method = method
+        self.status = None
+        self.recorded_at = now()
+        self.total_time = 0.0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.queries = Counter()  # SQL with placeholders -> times run
+        self._template_depth = 0
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    @property
+    def duplicate_count(self):
+        return sum(count - 1 for count in self.queries.values())
+
+    @property
+    def top_duplicate(self):
+        # The most repeated statement, usually the inner query of an N+1.
+        sql, count = self.queries.most_common(1)[0] if self.queries else (None, 0)
+        return (sql, count) if count > 1 else (None, 0)
+
+    @property
+    def view_time(self):
+        return max(self.total_time - self.sql_time - self.template_time, 0.0)
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries[sql] += 1
+
+
+_current_profile = ContextVar('products_request_profile', default=None)
+_template_render = Template.render
+_template_patch_lock = threading.Lock()
+_template_patch_users = 0
+
+
+def _profiled_template_render(self, context):
+    profile = _current_profile.get()
+    if profile is None:
+        return _template_render(self, context)
+    # {% include %} renders nested templates; only time the outermost one.
+    profile._template_depth += 1
+    started = time.perf_counter()
+    try:
+        return _template_render(self, context)
+    finally:
+        profile._template_depth -= 1
+        if not profile._template_depth:
+            profile.template_time += time.perf_counter() - started
+
+
+@contextmanager
+def _timing_templates():
+    """
+    Wrap Template.render while at least one sampled request is running and
+    put the original back once the last one finishes, so unsampled traffic
+    renders through Django's own method.
+    """
+    global _template_patch_users
+    with _template_patch_lock:
+        if not _template_patch_users:
+            Template.render = _profiled_template_render
+        _template_patch_users += 1
+    try:
+        yield
+    finally:
+        with _template_patch_lock:
+            _template_patch_users -= 1
+            if not _template_patch_users:
+                Template.render = _template_render
+
+
+def _endpoint(request):
+    match = request.resolver_match
+    if match is None:
+        return '<unresolved>'
+    return match.view_name or match.route
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if get_sample_rate() <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if random.random() >= get_sample_rate():
+            return self.get_response(request)
+        with self.profiling(request) as profile:
+            # TemplateResponses are rendered by the handler before they get here.
+            response = self.get_response(request)
+            profile.status = response.status_code
+        return response
+
+    async def __acall__(self, request):
+        if random.random() >= get_sample_rate():
+            return await self.get_response(request)
+        with self.profiling(request, wrap_queries=False) as profile:
+            # The async ORM queries from a worker thread with its own
+            # connection objects, so the wrappers are installed there.
+            queries = await sync_to_async(self.wrap_queries)(profile)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(queries.close)()
+            profile.status = response.status_code
+        return response
+
+    @contextmanager
+    def profiling(self, request, wrap_queries=True):
+        profile = RequestProfile(None, request.method)
+        token = _current_profile.set(profile)
+        started = time.perf_counter()
+        try:
+            with _timing_templates(), ExitStack() as stack:
+                if wrap_queries:
+                    stack.enter_context(self.wrap_queries(profile))
+                yield profile
+        finally:
+            _current_profile.reset(token)
+        profile.total_time = time.perf_counter() - started
+        profile.endpoint = _endpoint(request)
+        samples.append(profile)
+
+    def wrap_queries(self, profile):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(profile.record_query))
+        return stack
+
+
+def slowest_endpoints(profiles=None, limit=20):
+    """
+    Group samples by endpoint and return the ``limit`` slowest by average
+    total time, as dicts ready for the admin page.
+    """
+    groups = {}
+    for profile in samples.items() if profiles is None else profiles:
+        groups.setdefault((profile.method, profile.endpoint), []).append(profile)
+
+    rows = []
+    for (method, endpoint), group in groups.items():
+        count = len(group)
+        worst = max(group, key=lambda profile: profile.top_duplicate[1])
+        rows.append({
+            'method': method,
+            'endpoint': endpoint,
+            'samples': count,
+            'avg_ms': sum(profile.total_time for profile in group) / count * 1000,
+            'max_ms': max(profile.total_time for profile in group) * 1000,
+            'avg_sql_ms': sum(profile.sql_time for profile in group) / count * 1000,
+            'avg_view_ms': sum(profile.view_time for profile in group) / count * 1000,
+            'avg_template_ms': sum(profile.template_time for profile in group) / count * 1000,
+            'avg_queries': sum(profile.query_count for profile in group) / count,
+            'max_duplicates': worst.duplicate_count,
+            'top_duplicate': worst.top_duplicate,
+        })
+    rows.sort(key=lambda row: row['avg_ms'], reverse=True)
+    return rows[:limit]
@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import mm
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from .models import Product
+
+
+# Rows per table flowable; small tables keep reportlab's layout work linear.
+ROWS_PER_TABLE = 40
+
+TABLE_STYLE = TableStyle([
+    ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 9),
+    ('FONT', (0, 1), (-1, -1), 'Helvetica', 9),
+    ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+    ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+])
+
+
+def get_inline_report_limit():
+    # Above this many rows a report is queued as a background job instead.
+    return getattr(settings, 'PRODUCT_INLINE_REPORT_ROWS', 500)
+
+
+def with_serial_numbers(assignments):
+    # Assignments not linked to a product yet fall back to a hostname match.
+    by_hostname = Product.objects.filter(hostname=OuterRef('hostname')).values('serial_number')[:1]
+    return assignments.annotate(serial_number=Coalesce('product__serial_number', Subquery(by_hostname)))
+
+
+def assignment_rows(assignments, numbered=False):
+    rows = with_serial_numbers(assignments).values_list(
+        'hostname', 'serial_number', 'user__username', 'assigned_date', 'unassigned_date',
+    ).iterator(chunk_size=2000)
+    for index, (hostname, serial_number, username, assigned, unassigned) in enumerate(rows, start=1):
+        row = [
+            hostname,
+            serial_number or "N/A",
+            username or "N/A",
+            assigned.strftime('%Y-%m-%d'),
+            unassigned.strftime('%Y-%m-%d') if unassigned else "N/A",
+        ]
+        yield [str(index)] + row if numbered else row
+
+
+def write_assignment_pdf(output, title, assignments, numbered=False):
+    """
+    Write a hostname assignment table to ``output`` (any binary file-like
+    object). Rows are fetched with one query and laid out in page-sized
+    tables so long reports don't build one huge table in memory.
+    """
+    header = ["Hostname", "Serial Number", "User", "Assigned Date", "Unassigned Date"]
+    widths = [40 * mm, 35 * mm, 40 * mm, 30 * mm, 30 * mm]
+    if numbered:
+        header = ["No."] + header
+        widths = [12 * mm] + [width - 3 * mm for width in widths]
+
+    story = [Paragraph(title, getSampleStyleSheet()['Title']), Spacer(1, 4 * mm)]
+    chunk = []
+    for row in assignment_rows(assignments, numbered=numbered):
+        chunk.append(row)
+        if len(chunk) == ROWS_PER_TABLE:
+            story.append(Table([header] + chunk, colWidths=widths, style=TABLE_STYLE, repeatRows=1))
+            chunk = []
+    if chunk or len(story) == 2:
+        story.append(Table([header] + chunk, colWidths=widths, style=TABLE_STYLE, repeatRows=1))
+
+    document = SimpleDocTemplate(
+        output, pagesize=A4, title=title,
+        leftMargin=12 * mm, rightMargin=12 * mm, topMargin=12 * mm, bottomMargin=12 * mm,
+    )
+    document.build(story)
@@ -0,0 +1,201 @@
+from functools import reduce
+import operator
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+
+# Columns the helpdesk searches on, per model label.
+SEARCH_FIELDS = {
+    'products.product': (
+        'serial_number', 'model_number', 'hostname', 'mac_address', 'lan_ip', 'wan_ip', 'department', 'location',
+    ),
+    'products.hostnameassignment': ('hostname',),
+}
+
+# Columns the admin filters with plain icontains next to the index (see
+# IndexedSearchAdminMixin.extra_search_fields). PostgreSQL still gets a
+# trigram index for them; elsewhere they are small enough to scan.
+TRIGRAM_FIELDS = {
+    'auth.user': ('username',),
+}
+
+# Trigram matching needs at least three characters per term.
+MIN_TERM_LENGTH = 3
+
+
+def get_search_fields(model):
+    return SEARCH_FIELDS[model._meta.label_lower]
+
+
+def get_search_models():
+    from django.apps import apps
+    return [apps.get_model(label) for label in SEARCH_FIELDS]
+
+
+def split_terms(query):
+    return query.split()
+
+
+class SearchBackend:
+    """
+    Plain ``icontains`` matching; every term must match at least one field.
+    Subclasses make that fast for a particular database.
+    """
+
+    def install(self, model, using):
+        pass
+
+    def install_extra_indexes(self, using):
+        pass
+
+    def rebuild(self, model, using):
+        pass
+
+    def filter(self, queryset, query):
+        fields = get_search_fields(queryset.model)
+        for term in split_terms(query):
+            queryset = queryset.filter(reduce(operator.or_, (Q(**{f'{name}__icontains': term}) for name in fields)))
+        return queryset
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    An external-content FTS5 table with the trigram tokenizer per model, so
+    substring searches are index lookups rather than table scans. Triggers
+    keep it in sync with every write, including bulk and queryset updates.
+    """
+
+    def table(self, model):
+        return f'{model._meta.db_table}_search'
+
+    def install(self, model, using):
+        table = self.table(model)
+        source = model._meta.db_table
+        pk = model._meta.pk.column
+        columns = [model._meta.get_field(name).column for name in get_search_fields(model)]
+        column_list = ', '.join(columns)
+        new_values = ', '.join(f'new.{column}' for column in columns)
+        old_values = ', '.join(f'old.{column}' for column in columns)
+        insert = f"INSERT INTO {table} (rowid, {column_list}) VALUES (new.{pk}, {new_values});"
+        delete = f"INSERT INTO {table} ({table}, rowid, {column_list}) VALUES ('delete', old.{pk}, {old_values});"
+
+        with connections[using].cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [table])
+            exists = cursor.fetchone() is not None
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+                f"{column_list}, content='{source}', content_rowid='{pk}', tokenize='trigram')"
+            )
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON {source} BEGIN {insert} END")
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON {source} BEGIN {delete} END")
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF {pk}, {column_list} ON {source} "
+                f"BEGIN {delete} {insert} END"
+            )
+        if not exists:
+            self.rebuild(model, using)
+
+    def rebuild(self, model, using):
+        table = self.table(model)
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"INSERT INTO {table} ({table}) VALUES ('rebuild')")
+
+    def filter(self, queryset, query):
+        terms = split_terms(query)
+        if not terms or any(len(term) < MIN_TERM_LENGTH for term in terms):
+            return super().filter(queryset, query)
+        match = ' AND '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+        table = self.table(queryset.model)
+        return queryset.filter(pk__in=RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s", [match]))
+
+
+class PostgresTrigramSearchBackend(SearchBackend):
+    """
+    GIN trigram indexes on the exact expression Django's ``icontains``
+    compares against (UPPER("col"::text), or UPPER(HOST("col")) for inet
+    columns), so the plain lookups become index scans.
+    """
+
+    def install(self, model, using):
+        self.install_indexes(model, get_search_fields(model), using)
+
+    def install_extra_indexes(self, using):
+        from django.apps import apps
+        for label, fields in TRIGRAM_FIELDS.items():
+            self.install_indexes(apps.get_model(label), fields, using)
+
+    def install_indexes(self, model, fields, using):
+        connection = connections[using]
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            for name in fields:
+                field = model._meta.get_field(name)
+                column = connection.ops.quote_name(field.column)
+                expression = connection.ops.lookup_cast('icontains', field.get_internal_type()) % column
+                index = f'{table}_{field.column}_trgm'
+                if 'HOST(' in expression:
+                    # Replaces the earlier index on UPPER(col::text), which icontains never used.
+                    cursor.execute(f'DROP INDEX IF EXISTS {index}')
+                    index = f'{table}_{field.column}_host_trgm'
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {index} ON {table} USING gin (({expression}) gin_trgm_ops)'
+                )
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresTrigramSearchBackend,
+}
+
+
+def get_search_backend(using='default'):
+    path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    return BACKENDS.get(connections[using].vendor, SearchBackend)()
+
+
+def search(queryset, query):
+    return get_search_backend(queryset.db).filter(queryset, query)
+
+
+def install_search_index(using='default', **kwargs):
+    # Connected to post_migrate, so every migrate (and test database
+    # creation) leaves the index and its triggers in place.
+    backend = get_search_backend(using)
+    for model in get_search_models():
+        backend.install(model, using)
+    backend.install_extra_indexes(using)
+
+
+def rebuild_search_index(using='default'):
+    backend = get_search_backend(using)
+    for model in get_search_models():
+        backend.install(model, using)
+        backend.rebuild(model, using)
+    backend.install_extra_indexes(using)
+
+
+class IndexedSearchAdminMixin:
+    """
+    Answer the admin search box from the search index instead of the
+    ``icontains`` scans ModelAdmin builds from ``search_fields``. Fields in
+    ``extra_search_fields`` (usually across relations) are matched with
+    ``icontains`` as well.
+    """
+    extra_search_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        matches = search(queryset.model._default_manager.using(queryset.db), search_term)
+        condition = Q(pk__in=matches.values('pk'))
+        for name in self.extra_search_fields:
+            condition |= Q(**{f'{name}__icontains': search_term})
+        return queryset.filter(condition), False
@@ -0,0 +1,58 @@
+from rest_framework import serializers
+
+from .models import HostnameAssignment, Product, TransferLog
+
+
+class SparseFieldsMixin:
+    """
+    Limit the serialized fields to those named in ``?fields=a,b,c``.
+    Unknown names are ignored.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        requested = request.query_params.get('fields') if request is not None else None
+        if requested:
+            wanted = {name.strip() for name in requested.split(',')}
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    user = serializers.SlugRelatedField(slug_field='username', read_only=True)
+    users = serializers.SlugRelatedField(slug_field='username', many=True, read_only=True)
+    barcode_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Product
+        fields = [
+            'id', 'unique_id', 'hostname', 'host_name_category', 'item_type', 'model_number',
+            'serial_number', 'token', 'lan_ip', 'wan_ip', 'mac_address', 'location', 'department',
+            'number_id', 'user', 'users', 'barcode_url', 'created_at', 'updated_at',
+        ]
+
+    def get_barcode_url(self, obj):
+        url = obj.get_barcode_url()
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+
+class TransferLogSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    hostname = serializers.CharField(source='product.hostname', read_only=True)
+    serial_number = serializers.CharField(source='product.serial_number', read_only=True)
+    sender = serializers.SlugRelatedField(slug_field='username', read_only=True)
+    receiver = serializers.SlugRelatedField(slug_field='username', read_only=True)
+
+    class Meta:
+        model = TransferLog
+        fields = ['id', 'product', 'hostname', 'serial_number', 'sender', 'receiver', 'transferred_at']
+
+
+class HostnameAssignmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    user = serializers.SlugRelatedField(slug_field='username', read_only=True)
+    serial_number = serializers.CharField(source='product.serial_number', read_only=True, default=None)
+
+    class Meta:
+        model = HostnameAssignment
+        fields = ['id', 'hostname', 'product', 'serial_number', 'user', 'status', 'assigned_date', 'unassigned_date']
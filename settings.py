@@ -59,6 +59,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Samples PRODUCT_PROFILING_SAMPLE_RATE of requests; see products/profiling.py.
+    # 'products.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'barcode_project.urls'
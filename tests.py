@@ -1,3 +1,1096 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+import pandas as pd
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from openpyxl import Workbook
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import ResolverMatch, include, path, reverse
+from django.utils import timezone
+
+from . import async_views, profiling
+from .admin import Past7DaysFilter, ProductAdmin, UpdatedHourlyFilter, request_profiles_view
+from .analytics import monthly_spend, year_to_date
+from .api import router as api_router
+from .barcodes import barcode_cache, barcode_key, render_barcodes
+from .importers import UnsupportedFileFormat, import_products, read_sheet_chunks
+from .jobs import claim_next, enqueue, retry, spool_upload, work_once
+from .lookups import lookup_products, token_cache
+from .models import HostnameAssignment, Job, Product, SpendRollup, StockInvoice, StockReceive, TransferLog
+from .pagination import ApproximateCountPaginator, CursorPaginator
+from .profiling import ProfilingMiddleware
+from .reports import assignment_rows, write_assignment_pdf
+from .search import SearchBackend, search
+from .transfers import transfer_products
+from .views import barcode_image, job_result, job_status, product_list, upload_products
+
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('api/', include(api_router.urls)),
+    path('barcodes/<str:data>.<str:fmt>', barcode_image, name='barcode_image'),
+    path('jobs/<int:job_id>/', job_status, name='job_status'),
+    path('jobs/<int:job_id>/result/', job_result, name='job_result'),
+    path('upload/', upload_products, name='upload_products'),
+    path('profiling/', admin.site.admin_view(request_profiles_view), name='request_profiles'),
+]
+
+
+class TempMediaRootMixin:
+    """Point MEDIA_ROOT at a throwaway directory for each test."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = self.settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+
+class ChangelistQueryCountMixin:
+    """For a logged-in admin client: the changelist runs as many queries for 20 rows as for 2."""
+
+    def assertConstantQueries(self, model_name, add_rows, expected):
+        url = reverse(f'admin:products_{model_name}_changelist')
+        add_rows(0, 2)
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        add_rows(2, 20)
+        with CaptureQueriesContext(connection) as many:
+            self.assertContains(self.client.get(url), expected)
+        self.assertEqual(len(few), len(many))
+
+
+class ImportProductsTests(TestCase):
+    def test_creates_and_updates_in_batches(self):
+        Product.objects.create(host_name_category='Desktop', serial_number='SN1', department='IT')
+        df = pd.DataFrame({
+            'serial_number': ['SN1', 'SN2', 'SN3'],
+            'host_name_category': ['Laptop', 'Desktop', 'Desktop'],
+            'department': ['HR', 'Finance', None],
+        })
+
+        with self.assertNumQueries(6):
+            result = import_products(df, chunk_size=10)
+
+        self.assertEqual((result.created, result.updated, result.errors), (2, 1, []))
+        self.assertEqual(Product.objects.get(serial_number='SN1').department, 'HR')
+        self.assertEqual(Product.objects.values('token').distinct().count(), 3)
+        self.assertFalse(Product.objects.filter(barcode='').exists())
+
+    def test_collects_row_errors(self):
+        df = pd.DataFrame({
+            'serial_number': ['SN1', None, 'SN1', 'SERIAL-TOO-LONG-123'],
+            'host_name_category': ['Laptop', 'Laptop', 'Laptop', 'Laptop'],
+        })
+
+        result = import_products(df)
+
+        self.assertEqual(result.created, 1)
+        self.assertEqual([row for row, _ in result.errors], [3, 4, 5])
+
+    def test_create_only_rejects_existing_serials(self):
+        Product.objects.create(host_name_category='Desktop', serial_number='SN1')
+        df = pd.DataFrame({'serial_number': ['SN1'], 'host_name_category': ['Laptop']})
+
+        result = import_products(df, update_existing=False)
+
+        self.assertEqual(result.errors, [(2, "Serial number SN1 already exists.")])
+        self.assertEqual(Product.objects.get().host_name_category, 'Desktop')
+
+    def test_reimport_skips_unchanged_rows(self):
+        df = pd.DataFrame({
+            'serial_number': [f'SN{i}' for i in range(20)],
+            'host_name_category': ['Laptop'] * 20,
+            'department': ['IT'] * 20,
+        })
+        import_products(df, chunk_size=5)
+        df.loc[3, 'department'] = 'HR'
+
+        # A savepoint, a lookup and a release per batch, plus the one update.
+        with self.assertNumQueries(4 * 3 + 1):
+            result = import_products(df, chunk_size=5)
+
+        self.assertEqual((result.created, result.updated, result.unchanged), (0, 1, 19))
+        self.assertEqual(Product.objects.get(serial_number='SN3').department, 'HR')
+
+    def test_barcodes_render_after_each_batch_commits(self):
+        df = pd.DataFrame({'serial_number': ['SN1', 'SN2', 'SN3'], 'host_name_category': ['Laptop'] * 3})
+        depth = len(connection.savepoint_ids)
+        calls = []
+
+        def render(products, pool):
+            calls.append((len(products), pool, len(connection.savepoint_ids)))
+
+        with mock.patch('products.importers.barcode_pool', return_value=None) as pool, \
+                mock.patch('products.importers.render_barcodes', side_effect=render):
+            import_products(df, chunk_size=2)
+
+        pool.assert_called_once_with()
+        self.assertEqual(calls, [(2, None, depth), (1, None, depth)])
+
+    def test_manual_save_clears_fingerprint(self):
+        df = pd.DataFrame({'serial_number': ['SN1'], 'host_name_category': ['Laptop']})
+        import_products(df)
+        product = Product.objects.get()
+        self.assertTrue(product.import_fingerprint)
+
+        product.host_name_category = 'Desktop'
+        product.save()
+        result = import_products(df)
+
+        self.assertEqual((result.updated, result.unchanged), (1, 0))
+        self.assertEqual(Product.objects.get().host_name_category, 'Laptop')
+
+    def test_resume_skips_committed_rows(self):
+        serials = [f'SN{i}' for i in range(30)]
+        serials[12] = 'SN2'  # duplicates a row before the resume point
+        df = pd.DataFrame({'serial_number': serials, 'host_name_category': ['Laptop'] * 30})
+        reported = []
+
+        result = import_products(df, chunk_size=10, skip_rows=5, progress=lambda done, total: reported.append(done))
+
+        self.assertEqual(reported, [10, 20, 30])
+        self.assertEqual(result.created, 24)
+        self.assertEqual(result.errors, [(14, "Duplicate serial number SN2 in file.")])
+        self.assertFalse(Product.objects.filter(serial_number__in=serials[:5]).exists())
+
+
+class SheetReaderTests(TestCase):
+    def test_csv_is_read_in_chunks_of_import_columns(self):
+        lines = [' serial_number ,notes,department'] + [f'00{i},x,IT' for i in range(5)]
+        upload = ContentFile('\n'.join(lines).encode(), name='sheet.CSV')
+
+        frames = list(read_sheet_chunks(upload, chunk_size=2))
+
+        self.assertEqual([len(frame) for frame in frames], [2, 2, 1])
+        self.assertEqual([name.strip() for name in frames[0].columns], ['serial_number', 'department'])
+        self.assertEqual(frames[0].iloc[0, 0], '000')
+
+    def test_xlsx_is_streamed(self):
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(['serial_number', 'ignored', 'number_id', 'host_name_category'])
+        sheet.append(['SN1', 'x', 42, 'Laptop'])
+        sheet.append(['SN2', 'y', 5, 'Desktop'])
+        sheet.append([None, 'z', 7.0, 'Desktop'])
+        buffer = BytesIO()
+        workbook.save(buffer)
+
+        frames = list(read_sheet_chunks(ContentFile(buffer.getvalue(), name='sheet.xlsx'), chunk_size=2))
+
+        self.assertEqual([len(frame) for frame in frames], [2, 1])
+        self.assertEqual(list(frames[0].columns), ['serial_number', 'number_id', 'host_name_category'])
+        self.assertEqual(frames[1].values.tolist(), [[None, '7', 'Desktop']])
+
+        result = import_products(read_sheet_chunks(ContentFile(buffer.getvalue(), name='sheet.xlsx'), chunk_size=2))
+        self.assertEqual((result.created, result.errors), (2, [(4, "Missing serial number.")]))
+
+    def test_unsupported_format(self):
+        with self.assertRaises(UnsupportedFileFormat):
+            list(read_sheet_chunks(ContentFile(b'data', name='sheet.txt')))
+
+
+class TokenAssignmentTests(TestCase):
+    def test_create_issues_no_token_lookup(self):
+        with CaptureQueriesContext(connection) as queries:
+            Product.objects.create(host_name_category='Desktop', serial_number='SN1')
+
+        statements = [query['sql'].split()[0].upper() for query in queries]
+        self.assertNotIn('SELECT', statements)
+        self.assertEqual(statements.count('INSERT'), 1)
+
+    def test_retries_on_token_clash(self):
+        taken, fresh = uuid.uuid4(), uuid.uuid4()
+        Product.objects.create(host_name_category='Desktop', serial_number='SN1', token=str(taken))
+
+        with mock.patch('products.models.uuid.uuid4', side_effect=[taken, fresh]):
+            product = Product.objects.create(host_name_category='Desktop', serial_number='SN2')
+
+        self.assertEqual(product.token, str(fresh))
+
+    def test_other_integrity_errors_are_not_retried(self):
+        Product.objects.create(host_name_category='Desktop', serial_number='SN1')
+
+        with self.assertRaises(IntegrityError):
+            Product.objects.create(host_name_category='Desktop', serial_number='SN1')
+
+    def test_generate_tokens(self):
+        tokens = Product.generate_tokens(100)
+        self.assertEqual(len(set(tokens)), 100)
+
+
+class BarcodeRenderingTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        barcode_cache.clear()
+
+    def test_save_renders_only_when_payload_changes(self):
+        product = Product.objects.create(host_name_category='Desktop', serial_number='SN1')
+        self.assertTrue(product.barcode)
+
+        with mock.patch('products.barcodes.render_png') as render:
+            product.hostname = 'ICT-PC-01'
+            product.save()
+            Product.objects.get(pk=product.pk).save(update_fields=['hostname'])
+            render.assert_not_called()
+
+            render.return_value = b'png'
+            product.serial_number = 'SN2'
+            product.save()
+            render.assert_called_once_with('SN2')
+
+    def test_render_barcodes_skips_fresh_products(self):
+        fresh = Product.objects.create(host_name_category='Desktop', serial_number='SN1')
+        Product.objects.bulk_create([Product(host_name_category='Laptop', serial_number='SN2', token='t2')])
+
+        with self.assertNumQueries(2):
+            rendered = render_barcodes(Product.objects.order_by('pk'), workers=1)
+
+        self.assertEqual(rendered, 1)
+        self.assertEqual(Product.objects.get(pk=fresh.pk).barcode, fresh.barcode)
+        self.assertTrue(Product.objects.get(serial_number='SN2').barcode)
+
+    def test_products_with_the_same_payload_share_one_file(self):
+        first = Product.objects.create(host_name_category='Desktop', model_number='HP-800')
+        with mock.patch('products.barcodes.render_png') as render:
+            second = Product.objects.create(host_name_category='Desktop', model_number='HP-800')
+            render.assert_not_called()
+        self.assertEqual(first.barcode.name, second.barcode.name)
+
+    def test_barcode_image_view(self):
+        request = RequestFactory().get('/barcodes/SN1.svg')
+        response = barcode_image(request, 'SN1', 'svg')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        request = RequestFactory().get('/barcodes/SN1.svg', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(barcode_image(request, 'SN1', 'svg').status_code, 304)
+        with self.assertRaises(Http404):
+            barcode_image(RequestFactory().get('/barcodes/SN1.gif'), 'SN1', 'gif')
+
+    def test_barcode_image_only_stores_product_payloads(self):
+        Product.objects.create(host_name_category='Desktop', serial_number='SN1')
+        barcode_cache.clear()
+
+        for data in ('SN1', 'UNKNOWN-1'):
+            response = barcode_image(RequestFactory().get(f'/barcodes/{data}.svg'), data, 'svg')
+            self.assertEqual(response.status_code, 200)
+        self.assertTrue(barcode_cache.contains(barcode_key('SN1', 'svg'), 'svg'))
+        self.assertFalse(barcode_cache.contains(barcode_key('UNKNOWN-1', 'svg'), 'svg'))
+
+
+class ProductDirtyFieldTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Product.objects.create(host_name_category='Desktop', serial_number='SN1', department='IT')
+
+    def test_save_writes_only_changed_fields(self):
+        product = Product.objects.get()
+        self.assertEqual(product.get_dirty_fields(), set())
+        with self.assertNumQueries(0):
+            product.save()
+
+        product.department = 'HR'
+        self.assertEqual(product.get_dirty_fields(), {'department'})
+        with mock.patch('products.barcodes.render_png') as render, CaptureQueriesContext(connection) as queries:
+            product.save()
+        render.assert_not_called()
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"department"', queries[0]['sql'])
+        self.assertNotIn('"serial_number"', queries[0]['sql'])
+        self.assertEqual(product.get_dirty_fields(), set())
+        self.assertEqual(Product.objects.get().department, 'HR')
+
+    def test_partial_save_keeps_other_fields_dirty(self):
+        product = Product.objects.get()
+        product.hostname = 'PC1'
+        product.location = 'Lab'
+        product.save(update_fields=['hostname'])
+
+        self.assertEqual(product.get_dirty_fields(), {'location'})
+        product.refresh_from_db()
+        self.assertEqual((product.hostname, product.location), ('PC1', None))
+        self.assertEqual(product.get_dirty_fields(), set())
+
+    def test_partial_refresh_keeps_other_fields_dirty(self):
+        product = Product.objects.get()
+        product.department = 'HR'
+        product.location = 'Lab'
+        Product.objects.update(location='Store')
+
+        product.refresh_from_db(fields=['location'])
+        self.assertEqual(product.get_dirty_fields(), {'department'})
+        product.save()
+        self.assertEqual(Product.objects.values_list('department', 'location').get(), ('HR', 'Store'))
+
+    def test_loading_deferred_field_keeps_edits_dirty(self):
+        product = Product.objects.defer('location').get()
+        product.department = 'HR'
+        product.location  # loads the deferred field
+        self.assertEqual(product.get_dirty_fields(), {'department'})
+
+        product.save()
+        self.assertEqual(Product.objects.get().department, 'HR')
+
+    def test_assignment_leaves_unchanged_product_alone(self):
+        user = User.objects.create_user('user1')
+        Product.objects.update(hostname='PC1')
+        HostnameAssignment.objects.create(hostname='PC1', user=user, status='Assigned')
+
+        assignment = HostnameAssignment.objects.select_related('product').get()
+        with self.assertNumQueries(1):
+            assignment.save()
+
+
+class TransferReportExportTests(TestCase):
+    def test_streams_transfers_in_constant_queries(self):
+        sender = User.objects.create(username='alice')
+        receiver = User.objects.create(username='bob')
+        products = [
+            Product.objects.create(host_name_category='Desktop', serial_number=f'SN{i}', hostname=f'PC{i}', user=sender)
+            for i in range(5)
+        ]
+        for product in products:
+            TransferLog.objects.create(product=product, sender=sender, receiver=receiver)
+        TransferLog.objects.create(product=products[0], sender=None, receiver=receiver)
+        model_admin = ProductAdmin(Product, admin.site)
+
+        # One COUNT to decide between streaming and queueing, one to stream.
+        with self.assertNumQueries(2):
+            response = model_admin.download_transfer_report(RequestFactory().get('/'), Product.objects.all())
+            lines = b''.join(response.streaming_content).decode().splitlines()
+
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(lines[0], 'Host Name,Sender,Receiver,Transferred At')
+        self.assertEqual(len(lines), 7)
+        self.assertIn('PC0,N/A,bob,', '\n'.join(lines))
+
+
+class TransferProductsTests(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create(username='alice')
+        self.receiver = User.objects.create(username='bob')
+
+    def create_products(self, count, prefix):
+        return [
+            Product.objects.create(host_name_category='Desktop', serial_number=f'{prefix}{i}', user=self.sender)
+            for i in range(count)
+        ]
+
+    def test_matches_transfer_to(self):
+        products = self.create_products(3, 'SN')
+        products[0].users.add(self.receiver)
+        hour_ago = timezone.now() - timedelta(minutes=30)
+        Product.objects.filter(pk=products[1].pk).update(last_updated_hourly=hour_ago)
+
+        self.assertEqual(transfer_products(Product.objects.all(), self.receiver), 3)
+
+        for product in Product.objects.all():
+            self.assertEqual(list(product.users.all()), [self.receiver])
+            log = TransferLog.objects.get(product=product)
+            self.assertEqual((log.sender, log.receiver), (self.sender, self.receiver))
+        self.assertEqual(Product.objects.get(pk=products[1].pk).last_updated_hourly, hour_ago)
+        self.assertIsNotNone(Product.objects.get(pk=products[2].pk).last_updated_hourly)
+
+    def test_query_count_grows_with_batches(self):
+        self.create_products(10, 'A')
+        with self.settings(PRODUCT_TRANSFER_BATCH_SIZE=10):
+            with CaptureQueriesContext(connection) as one_batch:
+                transfer_products(Product.objects.all(), self.receiver)
+            self.create_products(15, 'B')
+            with CaptureQueriesContext(connection) as three_batches:
+                transfer_products(Product.objects.all(), self.receiver)
+        # Two more batches, three statements each: log inserts, m2m inserts, update.
+        self.assertEqual(len(three_batches), len(one_batch) + 2 * 3)
+        self.assertEqual(TransferLog.objects.count(), 35)
+        self.assertEqual(Product.objects.filter(users=self.receiver).count(), 25)
+        self.assertEqual(Product.objects.values('updated_at').distinct().count(), 1)
+
+    def test_admin_action(self):
+        self.create_products(2, 'SN')
+        superuser = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(superuser)
+        data = {
+            'action': 'transfer_selected', 'select_across': '1', 'index': 0, 'receiver': self.receiver.pk,
+            '_selected_action': list(Product.objects.values_list('pk', flat=True)),
+        }
+        response = self.client.post(reverse('admin:products_product_changelist'), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(TransferLog.objects.filter(receiver=self.receiver).count(), 2)
+
+        data['receiver'] = ''
+        self.client.post(reverse('admin:products_product_changelist'), data)
+        self.assertEqual(TransferLog.objects.count(), 2)
+
+
+class AssignmentReportTests(TestCase):
+    def test_pdf_is_built_from_one_query(self):
+        user = User.objects.create(username='alice')
+        for i in range(60):
+            Product.objects.create(host_name_category='Desktop', serial_number=f'SN{i}', hostname=f'PC{i}')
+            HostnameAssignment.objects.create(hostname=f'PC{i}', user=user, status='Assigned')
+        output = BytesIO()
+
+        with self.assertNumQueries(1):
+            write_assignment_pdf(output, "HOSTNAME ASSIGNMENT REPORT", HostnameAssignment.objects.all(), numbered=True)
+
+        self.assertTrue(output.getvalue().startswith(b'%PDF'))
+
+    def test_rows_include_serial_numbers(self):
+        user = User.objects.create(username='alice')
+        Product.objects.create(host_name_category='Desktop', serial_number='SN1', hostname='PC1')
+        HostnameAssignment.objects.create(hostname='PC1', user=user, status='Assigned')
+        HostnameAssignment.objects.create(hostname='PC2', user=user, status='Assigned')
+
+        rows = list(assignment_rows(HostnameAssignment.objects.order_by('hostname'), numbered=True))
+
+        self.assertEqual([row[:4] for row in rows], [['1', 'PC1', 'SN1', 'alice'], ['2', 'PC2', 'N/A', 'alice']])
+
+
+class JobTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def test_large_assignment_report_is_queued(self):
+        for i in range(3):
+            HostnameAssignment.objects.create(hostname=f'PC{i}', user=self.user, status='Assigned')
+        self.client.force_login(self.user)
+        data = {'action': 'export_as_pdf', '_selected_action': [a.pk for a in HostnameAssignment.objects.all()]}
+
+        with self.settings(PRODUCT_INLINE_REPORT_ROWS=2):
+            response = self.client.post(reverse('admin:products_hostnameassignment_changelist'), data)
+        self.assertEqual(response.status_code, 302)
+        job = Job.objects.get()
+        self.assertEqual((job.name, job.status, len(job.kwargs['ids'])), ('assignment_report', Job.QUEUED, 3))
+
+        self.assertEqual(work_once(), job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertRegex(job.result.name, r'^jobs/results/[0-9a-f]{32}/')
+        response = self.client.get(reverse('admin:products_job_download', args=[job.pk]))
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        self.assertIsNone(work_once())
+
+    def test_results_are_only_served_to_owner_or_staff(self):
+        owner = User.objects.create_user('owner')
+        TransferLog.objects.create(product=Product.objects.create(host_name_category='Desktop', hostname='PC1'))
+        job = enqueue('transfer_report', user=owner, product_ids=list(Product.objects.values_list('pk', flat=True)))
+        work_once()
+        job.refresh_from_db()
+
+        with override_settings(ROOT_URLCONF=__name__):
+            url = reverse('job_result', args=[job.pk])
+            self.client.force_login(owner)
+            self.assertEqual(self.client.get(reverse('job_status', args=[job.pk])).json()['result'], url)
+            content = b''.join(self.client.get(url).streaming_content).decode()
+            self.assertEqual(content.splitlines()[1].split(',')[:3], ['PC1', 'N/A', 'N/A'])
+
+            self.client.force_login(User.objects.create_user('other'))
+            self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(reverse('admin:products_job_download', args=[job.pk])).status_code, 302)
+
+    def test_stale_running_jobs_are_requeued(self):
+        job = enqueue('transfer_report', product_ids=[])
+        self.assertEqual(work_once(), job)
+        Job.objects.filter(pk=job.pk).update(status=Job.RUNNING, heartbeat_at=timezone.now() - timedelta(hours=2))
+
+        self.assertEqual(claim_next(), job)
+        running = enqueue('transfer_report', product_ids=[])
+        claim_next()
+        self.assertIsNone(claim_next())
+        self.assertEqual(Job.objects.get(pk=running.pk).status, Job.RUNNING)
+
+    def test_unsupported_upload_is_not_spooled(self):
+        self.client.force_login(self.user)
+        upload = ContentFile(b'x' * 20, name='sheet.txt')
+        with override_settings(ROOT_URLCONF=__name__, PRODUCT_INLINE_IMPORT_BYTES=10):
+            self.client.post(reverse('upload_products'), {'file': upload})
+        self.assertFalse(Job.objects.exists())
+        self.assertFalse(default_storage.exists('jobs/uploads'))
+
+    def test_import_job_reports_progress(self):
+        upload = ContentFile(b'serial_number,host_name_category\nSN1,Desktop\nSN2,Laptop\n', name='sheet.csv')
+        job = enqueue('import_products', user=self.user, path=spool_upload(upload), user_id=self.user.pk)
+
+        work_once()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress), (Job.DONE, 2))
+        self.assertEqual(Product.objects.filter(user=self.user).count(), 2)
+        self.assertFalse(default_storage.exists(job.kwargs['path']))
+
+    def test_failed_job_and_status_view(self):
+        job = enqueue('import_products', path='jobs/uploads/missing.csv')
+        with self.assertLogs('products.jobs', 'ERROR'):
+            work_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertTrue(job.message)
+
+        self.client.force_login(self.user)
+        with override_settings(ROOT_URLCONF=__name__):
+            response = self.client.get(reverse('job_status', args=[job.pk]))
+        self.assertEqual(response.json()['status'], Job.FAILED)
+
+    def test_failed_import_resumes_on_retry(self):
+        upload = ContentFile(b'serial_number,host_name_category\nSN1,Desktop\nSN2,Laptop\nSN3,Laptop\n', name='sheet.csv')
+        job = enqueue('import_products', path=spool_upload(upload))
+        failing = mock.patch('products.importers.render_barcodes', side_effect=[None, OSError('disk full')])
+        with self.settings(PRODUCT_IMPORT_CHUNK_SIZE=2), failing, self.assertLogs('products.jobs', 'ERROR'):
+            work_once()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress), (Job.FAILED, 2))
+        self.assertTrue(default_storage.exists(job.kwargs['path']))
+
+        self.assertEqual(retry(Job.objects.all()), 1)
+        with self.settings(PRODUCT_IMPORT_CHUNK_SIZE=2):
+            work_once()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress), (Job.DONE, 3))
+        # SN3 was committed before rendering failed; the retry only renders its barcode.
+        self.assertTrue(job.message.startswith("0 created, 0 updated, 1 unchanged"))
+        self.assertEqual(Product.objects.count(), 3)
+        self.assertTrue(Product.objects.get(serial_number='SN3').barcode)
+
+
+class HostnameAssignmentTests(ChangelistQueryCountMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='alice')
+
+    def test_save_links_product(self):
+        product = Product.objects.create(host_name_category='Desktop', serial_number='SN1', hostname='PC1')
+        assignment = HostnameAssignment.objects.create(hostname='PC1', user=self.user, status='Assigned')
+
+        self.assertEqual(assignment.product, product)
+        with self.assertNumQueries(0):
+            self.assertEqual(assignment.get_serial_number(), 'SN1')
+
+        assignment.status = 'Unassigned'
+        assignment.save()
+        product.refresh_from_db()
+        self.assertIsNone(product.hostname)
+
+    def test_editing_hostname_relinks_product(self):
+        first = Product.objects.create(host_name_category='Desktop', serial_number='SN1', hostname='PC1')
+        second = Product.objects.create(host_name_category='Desktop', serial_number='SN2', hostname='PC2')
+        HostnameAssignment.objects.create(hostname='PC1', user=self.user, status='Assigned')
+
+        assignment = HostnameAssignment.objects.get()
+        assignment.hostname = 'PC2'
+        assignment.save()
+
+        self.assertEqual(assignment.product, second)
+        self.assertEqual(assignment.get_serial_number(), 'SN2')
+        first.refresh_from_db()
+        self.assertEqual(first.hostname, 'PC1')
+
+    def test_backfill_products(self):
+        product = Product.objects.create(host_name_category='Desktop', serial_number='SN1', hostname='PC1')
+        assignment = HostnameAssignment.objects.create(hostname='PC1', user=self.user, status='Assigned')
+        HostnameAssignment.objects.filter(pk=assignment.pk).update(product=None)
+
+        self.assertEqual(HostnameAssignment.backfill_products(), 1)
+        self.assertEqual(HostnameAssignment.objects.get(pk=assignment.pk).product, product)
+
+    def test_changelist_query_count_is_constant(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+        def add_assignments(start, stop):
+            for i in range(start, stop):
+                Product.objects.create(host_name_category='Desktop', serial_number=f'SN{i}', hostname=f'PC{i}')
+                HostnameAssignment.objects.create(hostname=f'PC{i}', user=self.user, status='Assigned')
+
+        self.assertConstantQueries('hostnameassignment', add_assignments, 'SN19')
+
+
+class StockInvoiceTests(ChangelistQueryCountMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def add_invoices(self, start, stop):
+        for i in range(start, stop):
+            invoice = StockInvoice.objects.create(supplier_name='Acme', invoice_no=f'INV{i}', received_by=self.user)
+            for price in ('10.00', '2.50'):
+                StockReceive.objects.create(
+                    invoice=invoice, item_category='Laptop', quantity=2, unit_of_measure='pcs', unit_price=Decimal(price),
+                )
+
+    def test_totals(self):
+        self.add_invoices(0, 1)
+        StockInvoice.objects.create(supplier_name='Acme', invoice_no='EMPTY')
+        invoice = StockInvoice.objects.get(invoice_no='INV0')
+        self.assertEqual((invoice.total_items(), invoice.total_amount()), (2, Decimal('25.00')))
+        totals = {obj.invoice_no: (obj.total_items(), obj.total_amount()) for obj in StockInvoice.objects.with_totals()}
+        self.assertEqual(totals, {'INV0': (2, Decimal('25.00')), 'EMPTY': (0, Decimal('0.00'))})
+
+    def test_changelist_query_count_is_constant(self):
+        self.client.force_login(self.user)
+        self.assertConstantQueries('stockinvoice', self.add_invoices, 'INV19')
+
+
+class AdminChangelistQueryTests(ChangelistQueryCountMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+
+    def test_product_changelist(self):
+        def add_products(start, stop):
+            for i in range(start, stop):
+                owner = User.objects.create(username=f'owner{i}')
+                Product.objects.create(host_name_category='Desktop', serial_number=f'SN{i}', user=owner)
+
+        self.assertConstantQueries('product', add_products, 'owner19')
+
+    def test_product_transfer_counts_and_inline(self):
+        product = Product.objects.create(host_name_category='Laptop', serial_number='SHARED')
+        TransferLog.objects.bulk_create(
+            TransferLog(product=product, sender=self.user, receiver=self.user) for _ in range(60)
+        )
+        changelist = self.client.get(reverse('admin:products_product_changelist'))
+        self.assertEqual(changelist.context['cl'].result_list[0].transfer_count, 60)
+
+        with mock.patch('products.admin.TransferLogInline.max_transfers', 5):
+            response = self.client.get(reverse('admin:products_product_change', args=[product.pk]))
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual(len(formset.forms), 5)
+
+    def test_stock_receive_changelist(self):
+        def add_items(start, stop):
+            for i in range(start, stop):
+                receiver = User.objects.create(username=f'storekeeper{i}')
+                invoice = StockInvoice.objects.create(supplier_name=f'Supplier{i}', invoice_no=f'INV{i}', received_by=receiver)
+                StockReceive.objects.create(
+                    invoice=invoice, item_category='Laptop', quantity=1, unit_of_measure='pcs', unit_price=Decimal('10.00'),
+                )
+
+        self.assertConstantQueries('stockreceive', add_items, 'storekeeper19')
+
+
+class ProductTimeFilterTests(TestCase):
+    def filtered(self, filter_class, value):
+        request = RequestFactory().get('/')
+        list_filter = filter_class(request, {filter_class.parameter_name: value}, Product, ProductAdmin)
+        return list_filter.queryset(request, Product.objects.all())
+
+    def test_updated_filters_use_ranges(self):
+        current = Product.objects.create(host_name_category='Desktop', serial_number='NOW')
+        old = Product.objects.create(host_name_category='Desktop', serial_number='OLD')
+        Product.objects.filter(pk=old.pk).update(updated_at=timezone.now() - timedelta(days=400))
+
+        for value in ('hourly', 'today', 'past_7_days', 'this_month', 'this_year'):
+            queryset = self.filtered(UpdatedHourlyFilter, value)
+            self.assertEqual(list(queryset), [current], value)
+            sql = str(queryset.query)
+            self.assertNotIn('django_datetime', sql)
+            if connection.vendor == 'sqlite':
+                self.assertIn('USING INDEX products_product_updated_at', queryset.explain())
+
+    def test_past_7_days_filter_uses_exists(self):
+        sender = User.objects.create(username='alice')
+        recent = Product.objects.create(host_name_category='Desktop', serial_number='RECENT')
+        stale = Product.objects.create(host_name_category='Desktop', serial_number='STALE')
+        for _ in range(2):
+            TransferLog.objects.create(product=recent, sender=sender, receiver=sender)
+        TransferLog.objects.filter(
+            pk=TransferLog.objects.create(product=stale, sender=sender, receiver=sender).pk,
+        ).update(transferred_at=timezone.now() - timedelta(days=30))
+
+        queryset = self.filtered(Past7DaysFilter, 'True')
+        self.assertEqual(list(queryset), [recent])
+        self.assertIn('EXISTS', str(queryset.query))
+        self.assertNotIn('DISTINCT', str(queryset.query))
+        if connection.vendor == 'sqlite':
+            self.assertIn('USING COVERING INDEX products_tr', queryset.explain())
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.laptop = Product.objects.create(
+            host_name_category='Laptop', serial_number='5CG1234XYZ', hostname='NBO-LT-042',
+            mac_address='3C:52:82:AA:10:FF', lan_ip='10.0.4.17', department='Finance',
+        )
+        self.desktop = Product.objects.create(
+            host_name_category='Desktop', serial_number='MXL998877', hostname='MSA-PC-007', location='Mombasa',
+        )
+
+    def assertFinds(self, query, expected):
+        queryset = Product.objects.all()
+        self.assertEqual(set(search(queryset, query)), expected)
+        self.assertEqual(set(SearchBackend().filter(queryset, query)), expected)
+
+    def test_partial_matches(self):
+        self.assertFinds('1234', {self.laptop})
+        self.assertFinds('82:aa', {self.laptop})
+        self.assertFinds('10.0.4', {self.laptop})
+        self.assertFinds('momba', {self.desktop})
+        self.assertFinds('PC', {self.desktop})
+        self.assertFinds('finance NBO', {self.laptop})
+        self.assertFinds('finance MSA', set())
+
+    def test_index_follows_updates_and_deletes(self):
+        Product.objects.filter(pk=self.desktop.pk).update(hostname='KSM-PC-100')
+        self.assertFinds('KSM-PC', {self.desktop})
+        self.assertFinds('MSA-PC', set())
+        self.desktop.delete()
+        self.assertFinds('KSM-PC', set())
+
+    def test_sqlite_search_uses_fts_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5 index is SQLite only')
+        self.assertIn('VIRTUAL TABLE INDEX', search(Product.objects.all(), '82:aa').explain())
+
+    def test_admin_and_api_search(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin_user)
+        Product.objects.filter(pk=self.desktop.pk).update(user=admin_user)
+        HostnameAssignment.objects.create(hostname='NBO-LT-042', user=admin_user, status='Assigned')
+
+        response = self.client.get(reverse('admin:products_product_changelist'), {'q': 'XYZ'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.laptop])
+        response = self.client.get(reverse('admin:products_product_changelist'), {'q': 'ADMIN'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.desktop])
+        response = self.client.get(reverse('admin:products_product_changelist'), {'q': 'dmi'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.desktop])
+        response = self.client.get(reverse('admin:products_hostnameassignment_changelist'), {'q': 'lt-04'})
+        self.assertEqual(len(response.context['cl'].result_list), 1)
+
+        with override_settings(ROOT_URLCONF=__name__):
+            response = self.client.get('/api/products/search/', {'q': '5cg1'})
+            self.assertEqual([row['serial_number'] for row in response.json()['results']], ['5CG1234XYZ'])
+            self.assertEqual(self.client.get('/api/products/search/').status_code, 400)
+
+
+class SpendRollupTests(TestCase):
+    def receive(self, invoice, category, quantity, price):
+        return StockReceive.objects.create(
+            invoice=invoice, item_category=category, quantity=quantity, unit_of_measure='pcs', unit_price=Decimal(price),
+        )
+
+    def rollups(self):
+        return sorted(
+            SpendRollup.objects.exclude(quantity=0).values_list(
+                'period', 'period_start', 'supplier_name', 'item_category', 'quantity', 'amount',
+            )
+        )
+
+    def test_incremental_updates_match_rebuild(self):
+        acme = StockInvoice.objects.create(supplier_name='Acme', invoice_no='INV1', date_received=date(2026, 3, 14))
+        globex = StockInvoice.objects.create(supplier_name='Globex', invoice_no='INV2', date_received=date(2026, 3, 20))
+        laptop = self.receive(acme, 'Laptop', 2, '100.00')
+        self.receive(acme, 'Printer', 1, '50.00')
+        printer = self.receive(globex, 'Printer', 3, '40.00')
+
+        laptop.quantity = 5
+        laptop.save()
+        printer.delete()
+        acme.date_received = date(2026, 4, 2)
+        acme.save()
+        StockReceive.objects.filter(invoice=globex).delete()
+        self.receive(globex, 'Desktop', 1, '300.00')
+
+        incremental = self.rollups()
+        self.assertIn(('month', date(2026, 4, 1), 'Acme', 'Laptop', 5, Decimal('500.00')), incremental)
+        SpendRollup.rebuild()
+        self.assertEqual(incremental, self.rollups())
+
+    def test_year_to_date_reads_rollups_only(self):
+        for invoice_no, received in (('INV1', date(2025, 12, 30)), ('INV2', date(2026, 2, 10)),
+                                     ('INV3', date(2026, 3, 5)), ('INV4', date(2026, 3, 25))):
+            invoice = StockInvoice.objects.create(supplier_name='Acme', invoice_no=invoice_no, date_received=received)
+            self.receive(invoice, 'Laptop', 1, '10.00')
+
+        with self.assertNumQueries(1):
+            totals = year_to_date(today=date(2026, 3, 20))
+        self.assertEqual(totals, {'quantity': 2, 'amount': Decimal('20.00')})
+        self.assertEqual(
+            year_to_date('supplier_name', today=date(2026, 3, 31)),
+            [{'supplier_name': 'Acme', 'quantity': 3, 'amount': Decimal('30.00')}],
+        )
+        self.assertEqual(len(monthly_spend(months=4, today=date(2026, 3, 31))), 3)
+        with self.assertRaises(ValueError):
+            year_to_date('model_number')
+
+
+class ProductListTests(TestCase):
+    def test_top_products_per_user(self):
+        alice = User.objects.create(username='alice')
+        bob = User.objects.create(username='bob')
+        for i in range(10):
+            Product.objects.create(host_name_category='Desktop', serial_number=f'A{i}', user=alice)
+        Product.objects.create(host_name_category='Desktop', serial_number='B0', user=bob)
+        Product.objects.create(host_name_category='Desktop', serial_number='N0')
+
+        with mock.patch('products.views.render') as render, self.assertNumQueries(3):
+            product_list(RequestFactory().get('/'))
+
+        grouped = render.call_args[0][2]['grouped_products']
+        self.assertEqual(set(grouped), {alice, bob, None})
+        self.assertEqual([p.serial_number for p in grouped[alice]], [f'A{i}' for i in range(7)])
+        self.assertEqual(len(grouped[None]), 1)
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        Product.objects.bulk_create([
+            Product(host_name_category='Desktop', serial_number=f'SN{i}', token=f't{i}') for i in range(25)
+        ])
+        self.ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+
+    def test_walk_forward_and_back(self):
+        paginator = CursorPaginator(Product.objects.all(), 10)
+
+        with self.assertNumQueries(1):
+            first = paginator.get_page()
+        self.assertEqual([p.id for p in first], self.ids[:10])
+        self.assertFalse(first.has_previous())
+
+        second = paginator.get_page(after=first.next_cursor)
+        third = paginator.get_page(after=second.next_cursor)
+        self.assertEqual([p.id for p in third], self.ids[20:])
+        self.assertFalse(third.has_next())
+
+        back = paginator.get_page(before=third.previous_cursor)
+        self.assertEqual([p.id for p in back], self.ids[10:20])
+
+    def test_template_links_use_cursors(self):
+        paginator = CursorPaginator(Product.objects.all(), 10)
+        second = paginator.get_page(after=self.ids[9])
+        template = Template(
+            '{% if page.has_other_pages %}'
+            '{% if page.has_previous %}?before={{ page.previous_cursor }} {% endif %}'
+            '{% if page.has_next %}?after={{ page.next_cursor }}{% endif %}{% endif %}'
+        )
+        self.assertEqual(template.render(Context({'page': second})), f'?before={self.ids[10]} ?after={self.ids[19]}')
+        self.assertFalse(hasattr(second, 'next_page_number'))
+
+    def test_admin_approximate_counts_are_opt_in(self):
+        model_admin = ProductAdmin(Product, admin.site)
+        request = RequestFactory().get('/')
+        self.assertTrue(model_admin.show_full_result_count)
+
+        with self.settings(PRODUCT_ADMIN_APPROXIMATE_COUNTS=True):
+            paginator = model_admin.get_paginator(request, Product.objects.order_by('id'), 10)
+            self.assertIsInstance(paginator, ApproximateCountPaginator)
+            self.assertEqual(paginator.count, 25)
+            self.assertFalse(model_admin.show_full_result_count)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create(username='alice')
+        for i in range(10):
+            Product.objects.create(host_name_category='Desktop', serial_number=f'A{i}', user=self.alice)
+        self.product = Product.objects.create(host_name_category='Desktop', serial_number='N0')
+        TransferLog.objects.create(product=self.product, sender=self.alice, receiver=self.alice)
+
+    async def render_context(self, view, *args, path='/', **params):
+        with mock.patch('products.async_views.render') as render:
+            await view(RequestFactory().get(path, params), *args)
+        return render.call_args[0][2]
+
+    async def test_product_list_matches_sync_view(self):
+        context = await self.render_context(async_views.product_list)
+        self.assertEqual(set(context['grouped_products']), {self.alice, None})
+        self.assertEqual(len(context['grouped_products'][self.alice]), 7)
+        self.assertEqual(context['page_obj'].paginator.count, 2)
+
+    async def test_transfer_history(self):
+        context = await self.render_context(async_views.product_transfer_history, self.product.unique_id)
+        self.assertEqual([t.receiver for t in context['transfers']], [self.alice])
+        with self.assertRaises(Http404):
+            await async_views.product_transfer_history(RequestFactory().get('/'), uuid.uuid4())
+
+    async def test_inventory_list(self):
+        first = (await self.render_context(async_views.inventory_list))['products']
+        self.assertEqual(len(first), 11)
+        numbered = (await self.render_context(async_views.inventory_list, page='1'))['products']
+        self.assertEqual(list(numbered.object_list)[:3], list(first)[:3])
+
+
+class LoadTestCommandTests(TestCase):
+    def test_failed_requests_are_counted_and_fail_the_command(self):
+        out = StringIO()
+        # urlopen() raises ValueError here, which is neither an HTTP nor a socket error.
+        with self.assertRaisesMessage(CommandError, '3 requests failed.'):
+            call_command('loadtest', 'not-a-url', clients=2, requests=3, stdout=out)
+        self.assertIn('0 ok, 3 failed', out.getvalue())
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class ProductApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='alice')
+        self.client.force_login(self.user)
+        for i in range(5):
+            product = Product.objects.create(host_name_category='Desktop', serial_number=f'SN{i}', user=self.user)
+            product.users.add(self.user)
+
+    def test_list_with_sparse_fields(self):
+        with self.assertNumQueries(4):  # session, user, page, prefetched users
+            response = self.client.get('/api/products/', {'fields': 'serial_number,users'})
+
+        self.assertEqual(response.status_code, 200)
+        first = response.json()['results'][0]
+        self.assertEqual(first, {'serial_number': 'SN4', 'users': ['alice']})
+
+    def test_conditional_get(self):
+        response = self.client.get('/api/products/')
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        cached = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        Product.objects.filter(serial_number='SN0').update(updated_at=timezone.now() + timedelta(seconds=1))
+        changed = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+
+    def test_conditional_get_detail(self):
+        product = Product.objects.get(serial_number='SN1')
+        url = f'/api/products/{product.pk}/'
+        response = self.client.get(url)
+        self.assertEqual(response.json()['serial_number'], 'SN1')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        Product.objects.filter(pk=product.pk).update(updated_at=timezone.now() + timedelta(seconds=1))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        self.assertEqual(self.client.get('/api/products/abc/').status_code, 404)
+        self.assertEqual(self.client.get('/api/products/999999/').status_code, 404)
+
+    def test_batch_lookup(self):
+        token_cache.clear()
+        token = Product.objects.get(serial_number='SN1').token
+        Product.objects.filter(serial_number='SN2').update(model_number='HP-800')
+        codes = ['SN0', token, 'HP-800', 'UNKNOWN']
+
+        with self.assertNumQueries(6):  # session, user, serial, token, model, users
+            response = self.client.post('/api/products/lookup/', {'codes': codes}, content_type='application/json')
+
+        data = response.json()
+        self.assertEqual(data['missing'], ['UNKNOWN'])
+        self.assertEqual(data['results'][token][0]['serial_number'], 'SN1')
+        self.assertEqual(data['results']['HP-800'][0]['serial_number'], 'SN2')
+
+        with self.assertNumQueries(2):  # session, user
+            response = self.client.post('/api/products/lookup/', {'codes': [token]}, content_type='application/json')
+        self.assertEqual(response.json()['results'][token][0]['serial_number'], 'SN1')
+        self.assertEqual(response.json()['results'][token][0]['users'], ['alice'])
+
+    def test_cached_lookups_return_copies(self):
+        token_cache.clear()
+        token = Product.objects.get(serial_number='SN1').token
+        lookup_products([token])[0][token][0].department = 'Changed'
+
+        with self.assertNumQueries(0):
+            product = lookup_products([token])[0][token][0]
+        self.assertIsNone(product.department)
+        self.assertEqual([user.username for user in product.users.all()], ['alice'])
+
+    def test_batch_lookup_validates_codes(self):
+        response = self.client.post('/api/products/lookup/', {'codes': 'SN1'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_requires_authentication(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/api/assignments/').status_code, 403)
+
+
+def _duplicate_queries_view(request):
+    for product in Product.objects.order_by('id'):
+        product.get_transfer_history().count()
+    return HttpResponse(Template('{% for i in items %}{{ i }}{% endfor %}').render(Context({'items': [1, 2]})))
+
+
+async def _async_queries_view(request):
+    await Product.objects.acount()
+    return HttpResponse(await sync_to_async(Template('{{ n }}').render)(Context({'n': 1})))
+
+
+@override_settings(PRODUCT_PROFILING_SAMPLE_RATE=1)
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        profiling.samples.clear()
+        for i in range(3):
+            Product.objects.create(host_name_category='Desktop', serial_number=f'SN{i}')
+
+    def test_records_queries_duplicates_and_template_time(self):
+        middleware = ProfilingMiddleware(_duplicate_queries_view)
+        request = RequestFactory().get('/products/')
+        request.resolver_match = ResolverMatch(_duplicate_queries_view, (), {}, url_name='products', route='products/')
+
+        self.assertEqual(middleware(request).content, b'12')
+
+        profile, = profiling.samples.items()
+        self.assertEqual((profile.endpoint, profile.status, profile.query_count), ('products', 200, 4))
+        self.assertEqual(profile.duplicate_count, 2)
+        self.assertIn('products_transferlog', profile.top_duplicate[0])
+        self.assertGreater(profile.template_time, 0)
+        row, = profiling.slowest_endpoints()
+        self.assertEqual((row['endpoint'], row['samples'], row['max_duplicates']), ('products', 1, 2))
+
+    def test_template_render_is_only_wrapped_during_sampled_requests(self):
+        original = Template.render
+        seen = []
+
+        def view(request):
+            seen.append(Template.render)
+            return HttpResponse()
+
+        ProfilingMiddleware(view)(RequestFactory().get('/products/'))
+        self.assertIsNot(seen[0], original)
+        self.assertIs(Template.render, original)
+
+    async def test_async_requests(self):
+        middleware = ProfilingMiddleware(_async_queries_view)
+        self.assertTrue(iscoroutinefunction(middleware))
+
+        response = await middleware(RequestFactory().get('/products/'))
+
+        self.assertEqual(response.content, b'1')
+        profile, = profiling.samples.items()
+        self.assertEqual((profile.status, profile.query_count), (200, 1))
+        self.assertGreater(profile.template_time, 0)
+
+    def test_unsampled_requests_are_not_recorded(self):
+        with self.settings(PRODUCT_PROFILING_SAMPLE_RATE=0):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(_duplicate_queries_view)
+        middleware = ProfilingMiddleware(_duplicate_queries_view)
+        with self.settings(PRODUCT_PROFILING_SAMPLE_RATE=0.01), mock.patch('products.profiling.random.random', return_value=0.5):
+            middleware(RequestFactory().get('/products/'))
+        self.assertEqual(len(profiling.samples), 0)
+
+    def test_admin_page(self):
+        ProfilingMiddleware(_duplicate_queries_view)(RequestFactory().get('/products/'))
+        staff = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(staff)
+
+        with override_settings(ROOT_URLCONF=__name__), mock.patch('products.admin.render') as render:
+            render.return_value = HttpResponse()
+            self.client.get(reverse('request_profiles'))
+            self.assertEqual(render.call_args[0][2]['endpoints'][0]['endpoint'], '<unresolved>')
+            self.client.post(reverse('request_profiles'))
+        self.assertEqual(len(profiling.samples), 0)
+
+        self.client.logout()
+        with override_settings(ROOT_URLCONF=__name__):
+            self.assertEqual(self.client.get(reverse('request_profiles')).status_code, 302)
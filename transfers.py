@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, QuerySet, Value, When
+from django.utils.timezone import now
+
+from .models import Product, TransferLog
+
+
+# 200 rows keep each INSERT within SQLite's 999 bound parameters (a
+# TransferLog row takes four), so every batch is exactly three statements.
+DEFAULT_BATCH_SIZE = 200
+
+
+def get_batch_size():
+    return getattr(settings, 'PRODUCT_TRANSFER_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
+def transfer_products(products, new_user, batch_size=None):
+    """
+    Transfer many products to ``new_user`` at once, with the same effect as
+    calling Product.transfer_to() on each: a TransferLog per product, the
+    user added to ``users`` and the timestamps bumped.
+
+    Products are written ``batch_size`` at a time (PRODUCT_TRANSFER_BATCH_SIZE,
+    default 200) with three bulk statements per batch, all in one
+    transaction, so the number of queries grows with the number of batches
+    rather than the number of products. Returns the number of products
+    transferred.
+    """
+    if isinstance(products, QuerySet):
+        rows = list(products.values_list('pk', 'user_id'))
+    else:
+        rows = [(product.pk, product.user_id) for product in products]
+    if not rows:
+        return 0
+
+    batch_size = batch_size or get_batch_size()
+    timestamp = now()
+    stale = Q(last_updated_hourly__isnull=True) | Q(last_updated_hourly__lte=timestamp - timedelta(hours=1))
+    Through = Product.users.through
+    with transaction.atomic():
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            TransferLog.objects.bulk_create([
+                TransferLog(product_id=pk, sender_id=sender_id, receiver=new_user, transferred_at=timestamp)
+                for pk, sender_id in batch
+            ])
+            Through.objects.bulk_create(
+                [Through(product_id=pk, user_id=new_user.pk) for pk, _ in batch],
+                ignore_conflicts=True,
+            )
+            Product.objects.filter(pk__in=[pk for pk, _ in batch]).update(
+                updated_at=timestamp,
+                last_updated_hourly=Case(When(stale, then=Value(timestamp)), default=F('last_updated_hourly')),
+            )
+    return len(rows)
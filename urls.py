@@ -1,6 +1,11 @@
-from django.urls import path
+from django.contrib import admin
+from django.urls import include, path
+from . import async_views
+from .admin import request_profiles_view
+from .api import router as api_router
 from .views import download_pdf_report, download_excel_report
 from .views import product_list, print_product
+from .views import barcode_image, job_result, job_status
 from .views import upload_products
 from .views import product_list, transfer_product, product_transfer_history
 from .views import update_department
@@ -10,12 +15,21 @@ urlpatterns = [
     path('', product_list, name='product_list'),  # List products with pagination
     path('print/<int:product_id>/', print_product, name='print_product'),
     path('upload/', upload_products, name='upload_products'),
+    path('barcodes/<str:data>.<str:fmt>', barcode_image, name='barcode_image'),
+    path('api/', include(api_router.urls)),
+    path('jobs/<int:job_id>/', job_status, name='job_status'),
+    path('jobs/<int:job_id>/result/', job_result, name='job_result'),
     path("products/", product_list, name="product_list"),
     path("products/<uuid:product_id>/transfer/", transfer_product, name="transfer_product"),
     path("products/<uuid:product_id>/history/", product_transfer_history, name="product_transfer_history"),
     path("update-department/<uuid:product_id>/", update_department, name="update_department"),
+    # Async variants of the read views; only worthwhile when served through asgi.py.
+    path("async/products/", async_views.product_list, name="async_product_list"),
+    path("async/products/<uuid:product_id>/history/", async_views.product_transfer_history, name="async_product_transfer_history"),
+    path("async/inventory/", async_views.inventory_list, name="async_inventory_list"),
     path('admin/products/download-pdf/', download_pdf_report, name='admin_download_pdf'),
     path('admin/products/download-excel/', download_excel_report, name='admin_download_excel'),
+    path('profiling/', admin.site.admin_view(request_profiles_view), name='request_profiles'),
     # path('', views.login_page, name='landing'),
     # path('inventory/', views.inventory_list_view, name='inventory-list'),
 ]
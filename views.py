@@ -2,13 +2,50 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.models import User
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse, Http404, JsonResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
 from django.core.paginator import Paginator
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
 from django.utils.timezone import now
+import os
 from uuid import UUID
-import pandas as pd
+from barcode.errors import BarcodeError
+from .analytics import monthly_spend, year_to_date
+from .barcodes import FORMATS as BARCODE_FORMATS, barcode_cache, barcode_key, render as render_barcode
 from .forms import UploadFileForm, ProductUploadForm
-from .models import Product, ProductGroup, TransferLog
+from .importers import (
+    UnsupportedFileFormat, check_sheet_format, get_inline_import_size, import_products, read_sheet_chunks,
+)
+from .jobs import enqueue, spool_upload
+from .models import Job, Product, TransferLog
+from .pagination import CursorPaginator, parse_cursor
+
+
+MAX_IMPORT_ERROR_MESSAGES = 20
+
+
+def _report_import(request, result):
+    if result.created or result.updated:
+        messages.success(request, f"Products uploaded successfully! ({result.summary()})")
+    for row_number, error in result.errors[:MAX_IMPORT_ERROR_MESSAGES]:
+        messages.warning(request, f"Row {row_number}: {error}")
+    if len(result.errors) > MAX_IMPORT_ERROR_MESSAGES:
+        messages.warning(request, f"...and {len(result.errors) - MAX_IMPORT_ERROR_MESSAGES} more rows with errors.")
+
+
+def _queue_import(request, file, **kwargs):
+    # Large sheets are imported by a worker (manage.py run_jobs) so the
+    # request returns straight away.
+    if file.size <= get_inline_import_size():
+        return False
+    check_sheet_format(file)
+    user = request.user if request.user.is_authenticated else None
+    job = enqueue('import_products', user=user, path=spool_upload(file), **kwargs)
+    messages.info(request, f"The file is being imported in the background as job #{job.pk}.")
+    return True
 
 
 def upload_file(request):
@@ -16,40 +53,21 @@ def upload_file(request):
         form = UploadFileForm(request.POST, request.FILES)
         if form.is_valid():
             file = request.FILES['file']
+            user_id = request.user.pk if request.user.is_authenticated else None
             try:
-                # Read file with pandas
-                if file.name.endswith('.csv'):
-                    df = pd.read_csv(file)
-                elif file.name.endswith(('.xlsx', '.xls')):
-                    df = pd.read_excel(file)
-                else:
-                    messages.error(request, "Unsupported file format. Please upload a CSV or Excel file.")
+                if _queue_import(request, file, update_existing=False, user_id=user_id):
                     return redirect('upload_file')
-                
-                group = ProductGroup.objects.create(name="New Inventory Group")
-
-                # Iterate and create Product objects
-                for _, row in df.iterrows():
-                    Product.objects.create(
-                        host_name_category=row.get('host_name_category', ''),
-                        serial_number=row.get('serial_number', ''),
-                        model_number=row.get('model_number', ''),
-                        category=row.get('category', ''),
-                        country_id=row.get('country_id', ''),
-                        manufacturer_id=row.get('manufacturer_id', ''),
-                        number_id=row.get('number_id', ''),
-                        department=row.get('department', ''),
-                        users=row.get('users', ''),
-                        user=request.user,  # Assign current user
-                        group=group
-                    )
-
-                messages.success(request, "Products uploaded successfully!")
+                user = request.user if request.user.is_authenticated else None
+                result = import_products(read_sheet_chunks(file), user=user, update_existing=False)
+            except UnsupportedFileFormat:
+                messages.error(request, "Unsupported file format. Please upload a CSV or Excel file.")
                 return redirect('upload_file')
-
             except Exception as e:
                 messages.error(request, f"Error processing file: {str(e)}")
                 return redirect('upload_file')
+
+            _report_import(request, result)
+            return redirect('upload_file')
     else:
         form = UploadFileForm()
     
@@ -57,18 +75,36 @@ def upload_file(request):
     return render(request, 'upload.html', {'form': form, 'products': products})
 
 
+PRODUCTS_PER_USER = 7
+USERS_PER_PAGE = 25
+
+
 def product_list(request):
-    products = Product.objects.all().order_by('user')
-    
-    # Group by user and limit each user to 5 products
+    # Paginate over owners, then fetch only the first few products of each
+    # owner on the page with ROW_NUMBER() OVER (PARTITION BY user).
+    page = Paginator(_product_owner_ids(), USERS_PER_PAGE).get_page(request.GET.get("page"))
     grouped_products = {}
-    for product in products:
-        if product.user not in grouped_products:
-            grouped_products[product.user] = []
-        if len(grouped_products[product.user]) < 7:
-            grouped_products[product.user].append(product)
+    for product in _first_products_of(list(page)):
+        grouped_products.setdefault(product.user, []).append(product)
+
+    return render(request, "list.html", {"grouped_products": grouped_products, "page_obj": page})
+
+
+def _product_owner_ids():
+    return Product.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+
 
-    return render(request, "list.html", {"grouped_products": grouped_products})
+def _first_products_of(owner_ids):
+    owner_filter = Q(user_id__in=[owner_id for owner_id in owner_ids if owner_id is not None])
+    if None in owner_ids:
+        owner_filter |= Q(user__isnull=True)
+    return (
+        Product.objects.filter(owner_filter)
+        .select_related('user')
+        .annotate(rank=Window(RowNumber(), partition_by=[F('user_id')], order_by=F('id').asc()))
+        .filter(rank__lte=PRODUCTS_PER_USER)
+        .order_by('user_id', 'rank')
+    )
 
 
 def print_product(request, product_id):
@@ -80,6 +116,43 @@ def print_product(request, product_id):
     return HttpResponse(f"Printing product: {product.host_name_category}")
 
 
+# Barcode images are content addressed, so a URL never changes meaning.
+BARCODE_MAX_AGE = 60 * 60 * 24 * 365
+
+
+def _barcode_etag(request, data, fmt):
+    if fmt in BARCODE_FORMATS:
+        return barcode_key(data, fmt)
+
+
+def _is_product_barcode(data):
+    # Mirrors Product.get_barcode_data(): serial, model number, token or id.
+    condition = Q(serial_number=data) | Q(model_number=data) | Q(token=data)
+    if data.isdigit():
+        condition |= Q(pk=int(data))
+    return Product.objects.filter(condition).exists()
+
+
+@condition(etag_func=_barcode_etag)
+def barcode_image(request, data, fmt):
+    if fmt not in BARCODE_FORMATS:
+        raise Http404("Unknown barcode format")
+    key = barcode_key(data, fmt)
+    content = barcode_cache.get(key, fmt)
+    if content is None:
+        try:
+            content = render_barcode(data, fmt)
+        except BarcodeError:
+            return HttpResponse("Invalid barcode data", status=400)
+        # Only real payloads are stored; anything else anyone asks for is
+        # rendered on the fly so the cache cannot be filled from outside.
+        if _is_product_barcode(data):
+            barcode_cache.set(key, fmt, content)
+    response = HttpResponse(content, content_type=BARCODE_FORMATS[fmt][1])
+    patch_cache_control(response, public=True, max_age=BARCODE_MAX_AGE, immutable=True)
+    return response
+
+
 def create_product(request):
     if request.method == "POST":
         host_name_category = request.POST.get("host_name_category")
@@ -100,34 +173,18 @@ def upload_products(request):
         if form.is_valid():
             file = request.FILES['file']
             try:
-                # Read file
-                if file.name.endswith('.csv'):
-                    df = pd.read_csv(file)
-                elif file.name.endswith('.xlsx'):
-                    df = pd.read_excel(file)
-                else:
-                    messages.error(request, "Invalid file format. Please upload CSV or Excel.")
+                if _queue_import(request, file):
                     return redirect('upload_products')
-                
-                # Iterate and update/create products
-                for _, row in df.iterrows():
-                    product, created = Product.objects.update_or_create(
-                        serial_number=row.get("serial_number", None),
-                        defaults={
-                            "host_name_category": row.get("host_name_category", ""),
-                            "model_number": row.get("model_number", ""),
-                            "country_id": row.get("country_id", ""),
-                            "manufacturer_id": row.get("manufacturer_id", ""),
-                            "number_id": row.get("number_id", ""),
-                            "department": row.get("department", ""),
-                        }
-                    )
-                    product.save()
-                messages.success(request, "Products uploaded successfully!")
+                result = import_products(read_sheet_chunks(file))
+            except UnsupportedFileFormat:
+                messages.error(request, "Invalid file format. Please upload CSV or Excel.")
                 return redirect('upload_products')
             except Exception as e:
                 messages.error(request, f"Error processing file: {e}")
                 return redirect('upload_products')
+
+            _report_import(request, result)
+            return redirect('upload_products')
     else:
         form = ProductUploadForm()
     return render(request, "upload.html", {"form": form})
@@ -175,12 +232,21 @@ def transfer_to(self, new_owner):
     self.save()
 
 
-def inventory_list(request):
-    products_list = Product.objects.all()
-    paginator = Paginator(products_list, 20)  # Show 20 products per page
+INVENTORY_PAGE_SIZE = 20
 
-    page_number = request.GET.get("page")
-    products = paginator.get_page(page_number)
+
+def inventory_list(request):
+    # Old ?page= bookmarks keep working; inventory_pagination.html links
+    # by cursor (?after=<id> / ?before=<id>) so deep pages stay cheap.
+    if "page" in request.GET:
+        paginator = Paginator(Product.objects.order_by("id"), INVENTORY_PAGE_SIZE)
+        products = paginator.get_page(request.GET.get("page"))
+    else:
+        paginator = CursorPaginator(Product.objects.all(), INVENTORY_PAGE_SIZE)
+        products = paginator.get_page(
+            after=parse_cursor(request.GET.get("after")),
+            before=parse_cursor(request.GET.get("before")),
+        )
 
     return render(request, "base.html", {"products": products})    
 
@@ -192,4 +258,44 @@ def login_page(request):
 #CUSTOM ADMIN
 @login_required
 def dashboard_view(request):
-    return render(request, 'products/dashboard.html')
\ No newline at end of file
+    context = {
+        'year_to_date': year_to_date(),
+        'spend_by_supplier': year_to_date('supplier_name'),
+        'spend_by_category': year_to_date('item_category'),
+        'spend_by_unit': year_to_date('unit_of_measure'),
+        'monthly_spend': monthly_spend(),
+    }
+    return render(request, 'products/dashboard.html', context)
+
+
+def _get_visible_job(request, job_id):
+    job = get_object_or_404(Job, pk=job_id)
+    if not job.is_visible_to(request.user):
+        raise Http404("No job matches the given query.")
+    return job
+
+
+def job_result_response(job):
+    return FileResponse(job.result.open('rb'), as_attachment=True, filename=os.path.basename(job.result.name))
+
+
+@login_required
+def job_status(request, job_id):
+    job = _get_visible_job(request, job_id)
+    return JsonResponse({
+        'id': job.pk,
+        'name': job.name,
+        'status': job.status,
+        'progress': job.progress,
+        'total': job.total,
+        'message': job.message,
+        'result': reverse('job_result', args=[job.pk]) if job.result else None,
+    })
+
+
+@login_required
+def job_result(request, job_id):
+    job = _get_visible_job(request, job_id)
+    if not job.result:
+        raise Http404("This job has no result file.")
+    return job_result_response(job)
\ No newline at end of file